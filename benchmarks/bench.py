@@ -0,0 +1,239 @@
+#Benchmarks of the ledger pipeline against an in-memory fake of Google Sheets
+#Usage: python -m benchmarks.bench --sizes 1000 10000 --latency 0.05 --output report.json
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+import pandas as pd
+from benchmarks import fake_gspread
+from framework import aggregation, compact_ledger, ledger_store, rate_limit, sheet, update_history
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+SHEET_ID = "benchmark"
+TYPES = ["Food", "Housing", "Transport", "Fun", "Health", "Other"]
+APPEND_ROWS = 1_000
+NOISE_SECONDS = 0.01
+
+
+def make_rows(size:int, seed:int=0) -> list:
+    """
+    Rows of a worksheet holding size random transactions, header row first.
+    """
+    generator = random.Random(seed)
+    start = date(2020, 1, 1)
+    rows = [list(ledger_store.COLUMNS)]
+    for number in range(1, size + 1):
+        day = start + timedelta(days=generator.randrange(2_000))
+        rows.append([number, round(generator.uniform(1, 500), 2), day.strftime("%Y-%m-%d"), generator.choice(TYPES), ""])
+    return rows
+
+
+def partitioned(title:str, rows:list) -> dict:
+    """
+    Worksheets of a ledger split by year, as SheetsBackend lays them out, keyed by title.
+    """
+    worksheets = {}
+    for row in rows[1:]:
+        worksheets.setdefault(f"{title} {ledger_store.partition_of(row[2])}", [rows[0]]).append(row)
+    return dict(sorted(worksheets.items()))
+
+
+def _measure(results:list, client:fake_gspread.FakeClient, size:int, operation:str, func):
+    """
+    Time one operation and count the API calls it made.
+    """
+    before = client.calls.copy()
+    started = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - started
+    calls = client.calls - before
+    results.append({
+        "size": size,
+        "operation": operation,
+        "seconds": round(seconds, 6),
+        "api_calls": sum(calls.values()),
+        "calls": dict(calls),
+    })
+    return value
+
+
+def measure_memory(store, size:int) -> list:
+    """
+    Memory held by the spendings ledger as a list of record dicts and as a compact ledger.
+
+    Returns:
+        list: One result per layout: size, layout, rows, bytes and bytes per compact_ledger.ROWS_PER_REPORT rows.
+    """
+    tracemalloc.start()
+    records = store.fetch("spendings")
+    records_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    compact = compact_ledger.shared(store, "spendings")
+    results = []
+    for layout, held in (("records", records_bytes), ("compact", compact.nbytes()), ("compact_frame", compact.nbytes() + compact.frame_nbytes())):
+        results.append({
+            "size": size,
+            "layout": layout,
+            "rows": len(records),
+            "bytes": held,
+            "bytes_per_100k_rows": round(held / max(1, len(records)) * compact_ledger.ROWS_PER_REPORT),
+        })
+    return results
+
+
+def run_size(size:int, workdir:str, latency:float=0.0, error_rate:float=0.0, quota_per_minute:int=None, memory:list=None) -> list:
+    """
+    Run every benchmark on a spendings ledger of size rows (and an income ledger a quarter of it).
+
+    Args:
+        memory (list): Receives the memory measurements of the ledger, see measure_memory.
+
+    Returns:
+        list: One result per operation: size, operation, seconds, api_calls and calls per method.
+    """
+    results = []
+    client = fake_gspread.FakeClient(latency, error_rate, quota_per_minute)
+    client.add_spreadsheet(SHEET_ID, {
+        **partitioned(sheet.TITLES["spendings"], make_rows(size)),
+        **partitioned(sheet.TITLES["income"], make_rows(size // 4, seed=1)),
+        sheet.ARCHIVE_TITLE: [ledger_store.ARCHIVE_COLUMNS],
+    })
+    store = ledger_store.SQLiteBackend(os.path.join(workdir, f"ledger-{size}.db"))
+
+    def measure(operation:str, func):
+        return _measure(results, client, size, operation, func)
+
+    logger = measure("hydrate", lambda: sheet.SheetLogger(sheet_id=SHEET_ID, store=store, client=client))
+    logger.replicator.flush_interval = 0
+    logger.flush()  # Writes the archive of a fresh store, outside of the timed operations.
+    spendings, income = measure("fetch", lambda: logger.fetch_all(True, as_frame=True))
+    measure("fetch_cached", lambda: logger.fetch_all(True, as_frame=True))
+    if memory is not None:
+        memory.extend(measure_memory(store, size))
+    measure("aggregate_rollups", lambda: aggregation.rollup_summary(logger.rollups()))
+
+    edited = spendings.copy()
+    changed = random.Random(size).sample(range(size), max(1, size // 100))
+    edited.loc[changed, "Amount"] = edited.loc[changed, "Amount"] + 1
+    measure("diff", lambda: update_history.compare_data(edited, spendings))
+    measure("batch_update", lambda: (update_history.update_history("spendings", logger, edited, spendings), logger.flush()))
+
+    rows = [row[1:] for row in make_rows(min(size, APPEND_ROWS), seed=2)[1:]]
+    measure("append", lambda: (logger.log_rows("spendings", rows), logger.flush()))
+    measure("clear", lambda: (logger.clear_spending_sheet(), logger.flush()))
+    return results
+
+
+def compare(report:dict, baseline:dict, tolerance:float) -> list:
+    """
+    Operations that got slower than the baseline by more than tolerance (a fraction).
+
+    Differences under NOISE_SECONDS are ignored.
+    """
+    previous = {(result["size"], result["operation"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["size"], result["operation"]))
+        if before is None:
+            continue
+        slower = result["seconds"] > before["seconds"] * (1 + tolerance) and result["seconds"] - before["seconds"] > NOISE_SECONDS
+        if slower or result["api_calls"] > before["api_calls"]:
+            regressions.append({
+                "size": result["size"],
+                "operation": result["operation"],
+                "seconds": [before["seconds"], result["seconds"]],
+                "api_calls": [before["api_calls"], result["api_calls"]],
+            })
+    return regressions
+
+
+def run(sizes:list=SIZES, latency:float=0.0, error_rate:float=0.0, quota_per_minute:int=None, scheduler_quota:int=None) -> dict:
+    """
+    Run the benchmarks at every size.
+
+    Args:
+        sizes (list): Number of spendings rows of each run.
+        latency (float): Simulated seconds per API call.
+        error_rate (float): Simulated probability of a quota error per API call.
+        quota_per_minute (int): Simulated API quota, None for no limit.
+        scheduler_quota (int): Read and write quotas of the app's own rate limiter, None to disable it.
+
+    Returns:
+        dict: The report, with "meta" describing the run, "results" and "memory".
+    """
+    unlimited = 10 ** 9
+    rate_limit.set_scheduler(rate_limit.QuotaScheduler(
+        reads_per_minute=scheduler_quota or unlimited,
+        writes_per_minute=scheduler_quota or unlimited,
+        retries=8,
+        backoff=0.05,
+        max_backoff=1.0,
+    ))
+    results = []
+    memory = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            results.extend(run_size(size, workdir, latency, error_rate, quota_per_minute, memory))
+            print(f"{size} rows done", file=sys.stderr)
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "latency": latency,
+            "error_rate": error_rate,
+            "quota_per_minute": quota_per_minute,
+            "scheduler_quota": scheduler_quota,
+            "scheduler": rate_limit.get_scheduler().stats(),
+        },
+        "results": results,
+        "memory": memory,
+    }
+
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the ledger pipeline against a fake Google Sheet.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Spendings rows of each run.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per API call.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Simulated probability of a quota error.")
+    parser.add_argument("--quota-per-minute", type=int, default=None, help="Simulated API calls allowed per minute.")
+    parser.add_argument("--scheduler-quota", type=int, default=None, help="Quotas of the app's rate limiter, unlimited by default.")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline, as a fraction.")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.latency, args.error_rate, args.quota_per_minute, args.scheduler_quota)
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            report["regressions"] = compare(report, json.load(file), args.tolerance)
+
+    table = collections.defaultdict(dict)
+    for result in report["results"]:
+        table[result["operation"]][result["size"]] = f"{result['seconds']:.3f}s/{result['api_calls']}"
+    print(pd.DataFrame(table).T.to_string(), file=sys.stderr)
+    memory = collections.defaultdict(dict)
+    for result in report["memory"]:
+        memory[f"{result['layout']} (bytes/100k rows)"][result["size"]] = result["bytes_per_100k_rows"]
+    print(pd.DataFrame(memory).T.to_string(), file=sys.stderr)
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
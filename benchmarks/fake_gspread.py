@@ -0,0 +1,169 @@
+#In-memory stand-in for the parts of gspread the app uses
+import collections
+import json
+import random
+import threading
+import time
+import gspread
+
+
+class _Response:
+    """
+    Just enough of a requests.Response for gspread.exceptions.APIError.
+    """
+
+    def __init__(self, code:int, message:str):
+        self.status_code = code
+        self.text = json.dumps({"error": {"code": code, "message": message, "status": "RESOURCE_EXHAUSTED"}})
+
+    def json(self) -> dict:
+        return json.loads(self.text)
+
+
+class FakeClient:
+    """
+    Fake authorized gspread client holding one spreadsheet per key.
+
+    Every API call sleeps for latency seconds, fails with a 429 error with
+    probability error_rate, and fails too once more than quota_per_minute
+    calls were made within the last minute. Calls are counted per method.
+    """
+
+    def __init__(self, latency:float=0.0, error_rate:float=0.0, quota_per_minute:int=None, seed:int=0):
+        """
+        Args:
+            latency (float): Seconds every API call takes.
+            error_rate (float): Probability of a call failing with a quota error.
+            quota_per_minute (int): Calls allowed per minute, None for no limit.
+            seed (int): Seed of the random quota errors.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self.random = random.Random(seed)
+        self.calls = collections.Counter()
+        self.errors = 0
+        self.recent = collections.deque()
+        self.lock = threading.Lock()
+        self.spreadsheets = {}
+
+    def api_call(self, method:str) -> None:
+        """
+        Account for one API call: count it, wait for the latency and maybe raise a quota error.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.calls[method] += 1
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            self.recent.append(now)
+            over_quota = self.quota_per_minute is not None and len(self.recent) > self.quota_per_minute
+            failed = over_quota or self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise gspread.exceptions.APIError(_Response(429, "Quota exceeded for quota metric 'Requests'"))
+
+    def add_spreadsheet(self, key:str, worksheets:dict) -> "FakeSpreadsheet":
+        """
+        Args:
+            key (str): Spreadsheet key, as passed to open_by_key.
+            worksheets (dict): Rows of each worksheet (header row first), keyed by title.
+        """
+        self.spreadsheets[key] = FakeSpreadsheet(self, worksheets)
+        return self.spreadsheets[key]
+
+    def open_by_key(self, key:str) -> "FakeSpreadsheet":
+        self.api_call("open_by_key")
+        return self.spreadsheets[key]
+
+
+class FakeSpreadsheet:
+    def __init__(self, client:FakeClient, worksheets:dict):
+        self.client = client
+        self._worksheets = [FakeWorksheet(self, title, rows) for title, rows in worksheets.items()]
+
+    def worksheets(self) -> list:
+        self.client.api_call("worksheets")
+        return list(self._worksheets)
+
+    def add_worksheet(self, title:str, rows:int=1000, cols:int=26, index:int=None) -> "FakeWorksheet":
+        self.client.api_call("add_worksheet")
+        worksheet = FakeWorksheet(self, title, [])
+        self._worksheets.append(worksheet)
+        return worksheet
+
+    def values_batch_get(self, ranges:list) -> dict:
+        self.client.api_call("values_batch_get")
+        value_ranges = []
+        for name in ranges:
+            title, a1 = name.rsplit("!", 1)
+            worksheet = next(ws for ws in self._worksheets if ws.title == title.strip("'"))
+            start, end = a1.split(":")
+            first_row, first_column = gspread.utils.a1_to_rowcol(start)
+            last_column = gspread.utils.a1_to_rowcol(end + "1")[1]
+            values = [
+                ["" if value is None else str(value) for value in row[first_column - 1:last_column]]
+                for row in worksheet.rows[first_row - 1:]
+            ]
+            value_ranges.append({"range": name, "values": values} if values else {"range": name})
+        return {"valueRanges": value_ranges}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet:FakeSpreadsheet, title:str, rows:list):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [list(row) for row in rows]
+
+    def get_all_records(self) -> list:
+        self.spreadsheet.client.api_call("get_all_records")
+        if not self.rows:
+            return []
+        header = self.rows[0]
+        return [dict(zip(header, row)) for row in self.rows[1:]]
+
+    def append_row(self, values:list) -> None:
+        self.spreadsheet.client.api_call("append_row")
+        self.rows.append(list(values))
+
+    def append_rows(self, values:list) -> None:
+        self.spreadsheet.client.api_call("append_rows")
+        self.rows.extend(list(row) for row in values)
+
+    def update_cell(self, row:int, col:int, value) -> None:
+        self.spreadsheet.client.api_call("update_cell")
+        self._set(row, col, value)
+
+    def batch_update(self, data:list) -> None:
+        self.spreadsheet.client.api_call("batch_update")
+        for block in data:
+            row, col = gspread.utils.a1_to_rowcol(block["range"].split(":")[0])
+            for i, values in enumerate(block["values"]):
+                for j, value in enumerate(values):
+                    self._set(row + i, col + j, value)
+
+    def batch_clear(self, ranges:list) -> None:
+        self.spreadsheet.client.api_call("batch_clear")
+        for name in ranges:
+            start, end = name.split(":")
+            first_row, first_column = gspread.utils.a1_to_rowcol(start)
+            last_column = gspread.utils.a1_to_rowcol(end + "1")[1]
+            for cells in self.rows[first_row - 1:]:
+                for column in range(first_column - 1, min(last_column, len(cells))):
+                    cells[column] = ""
+            while self.rows and not any(value != "" for value in self.rows[-1]):
+                self.rows.pop()
+
+    def delete_rows(self, start:int, end:int=None) -> None:
+        self.spreadsheet.client.api_call("delete_rows")
+        del self.rows[start - 1:(end if end is not None else start)]
+
+    def _set(self, row:int, col:int, value) -> None:
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        cells.extend([""] * (col - len(cells)))
+        cells[col - 1] = value
@@ -0,0 +1,93 @@
+import threading
+import pandas as pd
+from framework import telemetry
+
+_cache = {}
+_cache_lock = threading.Lock()
+CACHE_SIZE = 8
+
+
+def rollup_summary(rollups:dict) -> dict:
+    """
+    Build the dashboard figures from materialized rollups (SheetLogger.rollups()).
+
+    The cost depends on the number of distinct days and types, not on the
+    length of the histories.
+
+    Returns:
+        dict:
+            - spendings_total / income_total (float): Sum of the amounts.
+            - spendings_last / income_last (float): Amount of the last record, None when empty.
+            - net_by_date (pd.DataFrame): "Net Spending" indexed by "Date".
+            - net_by_month (pd.DataFrame): "Net Spending" indexed by "Month".
+            - spendings_by_type / income_by_type (pd.DataFrame): "Type" and "Amount" columns.
+
+        Amounts are in the base currency, see scale_summary to show them in another one.
+    """
+    spendings, income = rollups["spendings"], rollups["income"]
+
+    def net(kind:str, index_name:str) -> pd.DataFrame:
+        net = pd.Series(spendings[kind], dtype=float).subtract(pd.Series(income[kind], dtype=float), fill_value=0)
+        if kind == "day":
+            net.index = pd.to_datetime(net.index, errors="coerce")
+            net = net[net.index.notna()]
+        return net.sort_index().rename("Net Spending").rename_axis(index_name).to_frame()
+
+    def by_type(totals:dict) -> pd.DataFrame:
+        return pd.DataFrame({"Type": list(totals.keys()), "Amount": list(totals.values())})
+
+    return {
+        "spendings_total": float(spendings["total"]),
+        "income_total": float(income["total"]),
+        "spendings_last": spendings["last"],
+        "income_last": income["last"],
+        "net_by_date": net("day", "Date"),
+        "net_by_month": net("month", "Month"),
+        "spendings_by_type": by_type(spendings["type"]),
+        "income_by_type": by_type(income["type"]),
+    }
+
+
+def scale_summary(summary:dict, rate:float) -> dict:
+    """
+    Dashboard figures with every amount multiplied by rate, e.g. to show them in another currency.
+
+    The memoized figures are shared by every session, so a new dict is returned.
+    """
+    if rate == 1:
+        return summary
+    scaled = {}
+    for key, value in summary.items():
+        if isinstance(value, pd.DataFrame):
+            value = value.copy()
+            value[value.select_dtypes("number").columns] *= rate
+        elif value is not None:
+            value = value * rate
+        scaled[key] = value
+    return scaled
+
+
+def _memoize(key, compute) -> dict:
+    with _cache_lock:
+        if key in _cache:
+            telemetry.cache("aggregation.summary", hits=1)
+            return _cache[key]
+    telemetry.cache("aggregation.summary", misses=1)
+    with telemetry.timer("aggregation.compute"):
+        result = compute()
+    with _cache_lock:
+        if len(_cache) >= CACHE_SIZE:
+            _cache.pop(next(iter(_cache)))
+        _cache[key] = result
+    return result
+
+
+def rollup_summary_cached(version, rollups) -> dict:
+    """
+    Return rollup_summary memoized by a data-version stamp.
+
+    Args:
+        version: Hashable stamp, e.g. SheetLogger.data_version().
+        rollups (dict | callable): SheetLogger.rollups() or the method itself.
+    """
+    return _memoize(version, lambda: rollup_summary(rollups() if callable(rollups) else rollups))
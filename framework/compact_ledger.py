@@ -0,0 +1,459 @@
+#Compact column-array ledgers, built once per version and shared read-only by every session
+import math
+import sys
+import threading
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from framework import date_index, ledger_store, telemetry
+
+DATE_FORMAT = '%Y-%m-%d'
+RECORD_COLUMNS = ledger_store.COLUMNS + [ledger_store.BASE_COLUMN]
+TEXT_COLUMNS = ("Type", "Comments", "Currency", "Rate Date")
+NUMBER_COLUMNS = ("Number", "Amount", ledger_store.BASE_COLUMN)
+ROWS_PER_REPORT = 100_000
+_date_cache = {}
+_date_cache_lock = threading.Lock()
+DATE_CACHE_SIZE = 100_000
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+@telemetry.timed("sheet.parse_dates")
+def parse_dates(values:list) -> tuple:
+    """
+    Parse ISO dates ('YYYY-MM-DD') in one vectorized pass.
+
+    Each distinct string is parsed once: the strings not yet in the
+    process-wide cache are parsed together with pandas, the rest are looked up.
+    Malformed values become NaT instead of raising.
+
+    Args:
+        values (list): Date strings; dates and datetimes are passed through.
+
+    Returns:
+        tuple: (pd.Series of datetime64 values, list of positions that could not be parsed)
+    """
+    keys = pd.Series(values, dtype=object).reset_index(drop=True)
+    if pd.api.types.infer_dtype(keys, skipna=True) not in ("string", "empty"):
+        keys = keys.map(ledger_store.cell_value)
+    uniques = pd.unique(keys.dropna())
+    with _date_cache_lock:
+        unknown = [key for key in uniques if key not in _date_cache]
+        telemetry.cache("sheet.date_cache", len(uniques) - len(unknown), len(unknown))
+        if unknown:
+            parsed = pd.to_datetime(pd.Series(unknown, dtype=object), format=DATE_FORMAT, errors="coerce")
+            if len(_date_cache) + len(unknown) > DATE_CACHE_SIZE:
+                _date_cache.clear()
+            _date_cache.update(zip(unknown, parsed))
+        lookup = {key: _date_cache[key] for key in uniques}
+    dates = pd.to_datetime(keys.map(lookup))
+    invalid = [int(position) for position in (dates.isna() & (keys.fillna("") != "")).to_numpy().nonzero()[0]]
+    return dates, invalid
+
+
+def _code_dtype(size:int) -> np.dtype:
+    """
+    Smallest integer type holding the codes of size categories.
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if size <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _encode(values:pd.Series) -> tuple:
+    """
+    Categorical codes of text values.
+
+    Returns:
+        tuple: (codes array, tuple of the distinct strings, interned)
+    """
+    categorical = pd.Categorical(values)
+    categories = tuple(sys.intern(category) for category in categorical.categories)
+    return categorical.codes.astype(_code_dtype(len(categories))), categories
+
+
+def _optional(value:float, cast):
+    return None if math.isnan(value) else cast(value)
+
+
+def _readonly(array:np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+class Transaction(Mapping):
+    """
+    Read-only view of one row of a CompactLedger.
+
+    It reads like the record dicts the ledgers used to be held as
+    (row["Amount"], row.get("Type"), dict(row)) while holding only two references.
+    """
+
+    __slots__ = ("ledger", "position")
+
+    def __init__(self, ledger, position:int):
+        self.ledger = ledger
+        self.position = position
+
+    def __getitem__(self, column:str):
+        return self.ledger.value(column, self.position)
+
+    def __iter__(self):
+        return iter(RECORD_COLUMNS)
+
+    def __len__(self) -> int:
+        return len(RECORD_COLUMNS)
+
+    def __repr__(self) -> str:
+        return f"Transaction({dict(self)})"
+
+
+class CompactLedger:
+    """
+    Rows of a ledger held as one array per column instead of one dict per row.
+
+    Amounts are float64 arrays (NaN when missing or unreadable), dates a
+    datetime64 array (NaT when missing, the text of malformed dates is kept
+    aside) and the text columns small integer codes into tuples of interned
+    strings, so a row costs a few dozen bytes however many sessions read it.
+    Besides the ledger columns it holds the amounts in the base currency under
+    ledger_store.BASE_COLUMN, NaN for rows waiting for a conversion.
+
+    The arrays are read-only: a write produces a new ledger sharing the
+    untouched columns, so a ledger can be handed to every session at once.
+    """
+
+    def __init__(self, arrays:dict, categories:dict, invalid_dates:dict, version:int=None):
+        """
+        Args:
+            arrays (dict): Array of every column, codes for the text columns.
+            categories (dict): Strings of the codes of every text column.
+            invalid_dates (dict): Text of the malformed dates by position.
+            version (int): Version of the ledger in the local store.
+        """
+        self.arrays = {column: _readonly(array) for column, array in arrays.items()}
+        self.categories = categories
+        self.invalid_dates = invalid_dates
+        self.version = version
+        self.lock = threading.Lock()
+        self._frame = None
+        self._date_index = None
+
+    @classmethod
+    def from_rows(cls, rows:list, version:int=None):
+        """
+        Build a ledger from rows as read from the local store.
+
+        Args:
+            rows (list): [Number, Amount, Date, Type, Comments, Currency, Rate Date] rows of the same
+                length, optionally followed by the stored amount in the base currency.
+        """
+        columns = list(zip(*rows))[:len(RECORD_COLUMNS)]
+        columns += [(None,) * len(rows)] * (len(RECORD_COLUMNS) - len(columns))
+        values = {column: pd.Series(columns[i], dtype=object) for i, column in enumerate(RECORD_COLUMNS)}
+        arrays, categories = {}, {}
+        for column in NUMBER_COLUMNS:
+            arrays[column] = pd.to_numeric(values[column], errors="coerce").to_numpy(dtype=float)
+        dates, invalid = parse_dates(values["Date"])
+        arrays["Date"] = dates.to_numpy(dtype="datetime64[ns]")
+        for column in TEXT_COLUMNS:
+            text = values[column]
+            if column == "Rate Date" and pd.api.types.infer_dtype(text, skipna=True) not in ("string", "empty"):
+                text = text.map(ledger_store.cell_value)
+            arrays[column], categories[column] = _encode(text.fillna("").astype(str))
+        ledger = cls(arrays, categories, {position: str(values["Date"][position]) for position in invalid}, version)
+        return ledger._with_bases(np.arange(len(rows)))
+
+    def __len__(self) -> int:
+        return len(self.arrays["Amount"])
+
+    def __getitem__(self, position:int) -> Transaction:
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return Transaction(self, position)
+
+    def __iter__(self):
+        return (Transaction(self, position) for position in range(len(self)))
+
+    def value(self, column:str, position:int):
+        """
+        Value of one cell, as the record dicts held it.
+        """
+        if column == "Number":
+            return _optional(self.arrays[column][position], int)
+        if column in NUMBER_COLUMNS:
+            return _optional(self.arrays[column][position], float)
+        if column == "Date":
+            date = self.arrays["Date"][position]
+            return self.invalid_dates.get(position, "") if np.isnat(date) else str(np.datetime_as_string(date, unit="D"))
+        if column in TEXT_COLUMNS:
+            return self.categories[column][self.arrays[column][position]]
+        raise KeyError(column)
+
+    def _strings(self, column:str) -> np.ndarray:
+        """
+        Object array of the strings of a text column, pointing at the shared categories.
+        """
+        return np.array(self.categories[column], dtype=object)[self.arrays[column]]
+
+    def records(self, convert_date:bool=False) -> list:
+        """
+        The rows as a list of new record dicts, for callers that modify them.
+
+        Args:
+            convert_date (bool): Dates as datetimes (None when missing or malformed) instead of strings.
+        """
+        columns = {
+            "Number": [_optional(value, int) for value in self.arrays["Number"].tolist()],
+            "Amount": [_optional(value, float) for value in self.arrays["Amount"].tolist()],
+        }
+        dates = self.arrays["Date"]
+        if convert_date:
+            columns["Date"] = [None if pd.isna(date) else date for date in pd.Series(dates, dtype="datetime64[ns]").dt.to_pydatetime()]
+        else:
+            columns["Date"] = np.datetime_as_string(dates, unit="D").tolist()
+            for position in np.flatnonzero(np.isnat(dates)).tolist():
+                columns["Date"][position] = self.invalid_dates.get(position, "")
+        for column in TEXT_COLUMNS:
+            columns[column] = self._strings(column).tolist()
+        columns[ledger_store.BASE_COLUMN] = [_optional(value, float) for value in self.arrays[ledger_store.BASE_COLUMN].tolist()]
+        return [dict(zip(RECORD_COLUMNS, row)) for row in zip(*(columns[column] for column in RECORD_COLUMNS))]
+
+    def date_errors(self) -> list:
+        """
+        Rows with a malformed date: {"row": row of the ledger with its partitions laid end to end, "Number": ..., "Date": the malformed text}.
+        """
+        return [
+            {"row": position + 2, "Number": self.value("Number", position), "Date": text}
+            for position, text in sorted(self.invalid_dates.items())
+        ]
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Typed DataFrame of the ledger, built on first use and shared by every reader. Not to be modified.
+
+        Columns: "Number" (Int64), "Amount" and ledger_store.BASE_COLUMN (float),
+        "Date" (datetime64, NaT when missing or malformed) and the text columns (str).
+        """
+        with self.lock:
+            telemetry.cache("sheet.frames", *((1, 0) if self._frame is not None else (0, 1)))
+            if self._frame is None:
+                self._frame = pd.DataFrame({
+                    "Number": pd.array(self.arrays["Number"], dtype="Int64"),
+                    "Amount": self.arrays["Amount"],
+                    "Date": self.arrays["Date"],
+                    **{column: self._strings(column) for column in TEXT_COLUMNS},
+                    ledger_store.BASE_COLUMN: self.arrays[ledger_store.BASE_COLUMN],
+                }, columns=RECORD_COLUMNS)
+            return self._frame
+
+    def date_index(self) -> date_index.DateIndex:
+        """
+        Sorted date index of the amounts in the base currency, built on first use.
+
+        Its positions are rows of frame().
+        """
+        frame = self.frame()
+        with self.lock:
+            telemetry.cache("sheet.date_indexes", *((1, 0) if self._date_index is not None else (0, 1)))
+            if self._date_index is None:
+                with telemetry.timer("sheet.build_date_index"):
+                    self._date_index = date_index.DateIndex(frame, ledger_store.BASE_COLUMN)
+            return self._date_index
+
+    def memory_usage(self) -> dict:
+        """
+        Bytes held by every column: its array plus, for text columns, the strings of its categories.
+        """
+        usage = {column: array.nbytes for column, array in self.arrays.items()}
+        for column, categories in self.categories.items():
+            usage[column] += sys.getsizeof(categories) + sum(sys.getsizeof(category) for category in categories)
+        usage["Date"] += sys.getsizeof(self.invalid_dates) + sum(sys.getsizeof(text) for text in self.invalid_dates.values())
+        return usage
+
+    def nbytes(self) -> int:
+        return sum(self.memory_usage().values())
+
+    def frame_nbytes(self) -> int:
+        """
+        Bytes of the typed DataFrame, 0 until it is built. Strings are counted once, they are shared with the categories.
+        """
+        return 0 if self._frame is None else int(self._frame.memory_usage(index=True, deep=False).sum())
+
+    def _with_bases(self, positions:np.ndarray):
+        """
+        Recompute the amounts in the base currency of rows whose amount or currency changed.
+
+        Amounts entered in the base currency (or without a currency) are their
+        own base amount, the others keep their stored conversion or NaN.
+        """
+        if len(positions) == 0:
+            return self
+        in_base = np.array([category in ("", ledger_store.BASE_CURRENCY) for category in self.categories["Currency"]], dtype=bool)
+        positions = positions[in_base[self.arrays["Currency"][positions]]]
+        if len(positions):
+            bases = self.arrays[ledger_store.BASE_COLUMN].copy()
+            bases[positions] = self.arrays["Amount"][positions]
+            self.arrays[ledger_store.BASE_COLUMN] = _readonly(bases)
+        return self
+
+    def _merged_codes(self, column:str, other) -> tuple:
+        """
+        Codes of a text column of self followed by other, over the categories of both.
+        """
+        categories = list(self.categories[column])
+        lookup = {category: code for code, category in enumerate(categories)}
+        mapping = []
+        for category in other.categories[column]:
+            if category not in lookup:
+                lookup[category] = len(categories)
+                categories.append(category)
+            mapping.append(lookup[category])
+        dtype = _code_dtype(len(categories))
+        other_codes = np.array(mapping, dtype=dtype)[other.arrays[column]] if mapping else np.empty(0, dtype=dtype)
+        return np.concatenate([self.arrays[column].astype(dtype), other_codes]), tuple(categories)
+
+    def appended(self, rows:list):
+        """
+        New ledger with rows appended at the end.
+
+        Args:
+            rows (list): [Number, Amount, Date, Type, Comments, Currency, Rate Date] rows.
+        """
+        other = CompactLedger.from_rows(rows)
+        arrays, categories = {}, {}
+        for column in NUMBER_COLUMNS + ("Date",):
+            arrays[column] = np.concatenate([self.arrays[column], other.arrays[column]])
+        for column in TEXT_COLUMNS:
+            arrays[column], categories[column] = self._merged_codes(column, other)
+        invalid_dates = {**self.invalid_dates, **{position + len(self): text for position, text in other.invalid_dates.items()}}
+        return CompactLedger(arrays, categories, invalid_dates)
+
+    def with_changes(self, changes:list[list[int, int, str]]):
+        """
+        New ledger with cell changes applied; the columns not changed are shared with this one.
+
+        Args:
+            changes (list): [row, column, value] cell changes, sheet coordinates (row 2 is the first record).
+        """
+        arrays, categories, invalid_dates = dict(self.arrays), dict(self.categories), dict(self.invalid_dates)
+        copied, lookups, rebased = set(), {}, []
+
+        def writable(column:str) -> np.ndarray:
+            if column not in copied:
+                arrays[column] = arrays[column].copy()
+                copied.add(column)
+            return arrays[column]
+
+        for row, column, value in changes:
+            position = row - 2
+            if not (0 <= position < len(self) and 1 <= column <= len(ledger_store.COLUMNS)):
+                continue
+            name = ledger_store.COLUMNS[column - 1]
+            value = ledger_store.cell_value(value)
+            if name in NUMBER_COLUMNS:
+                writable(name)[position] = pd.to_numeric(value, errors="coerce")
+            elif name == "Date":
+                dates, invalid = parse_dates([value])
+                writable(name)[position] = dates.to_numpy(dtype="datetime64[ns]")[0]
+                invalid_dates.pop(position, None)
+                if invalid:
+                    invalid_dates[position] = str(value)
+            else:
+                text = "" if value is None else str(value)
+                if name not in lookups:
+                    lookups[name] = {category: code for code, category in enumerate(categories[name])}
+                if text not in lookups[name]:
+                    lookups[name][text] = len(categories[name])
+                    categories[name] = categories[name] + (sys.intern(text),)
+                    if len(categories[name]) > np.iinfo(arrays[name].dtype).max:
+                        arrays[name] = arrays[name].astype(_code_dtype(len(categories[name])))
+                        copied.add(name)
+                writable(name)[position] = lookups[name][text]
+            if name in ("Amount", "Currency", "Rate Date"):
+                writable(ledger_store.BASE_COLUMN)[position] = np.nan
+                rebased.append(position)
+        return CompactLedger(arrays, categories, invalid_dates)._with_bases(np.array(rebased, dtype=int))
+
+    def without_rows(self, rows:list[int]):
+        """
+        New ledger without some rows.
+
+        Args:
+            rows (list): Sheet rows to delete (row 2 is the first record).
+        """
+        deleted = np.array(sorted({row - 2 for row in rows if 2 <= row < len(self) + 2}), dtype=int)
+        keep = np.ones(len(self), dtype=bool)
+        keep[deleted] = False
+        arrays = {column: array[keep] for column, array in self.arrays.items()}
+        invalid_dates = {
+            position - int(np.searchsorted(deleted, position)): text
+            for position, text in self.invalid_dates.items() if keep[position]
+        }
+        return CompactLedger(arrays, dict(self.categories), invalid_dates)
+
+
+def publish(store, ledger:str, compact:CompactLedger) -> CompactLedger:
+    """
+    Share a ledger with every session of the process, unless a newer version of it already is.
+
+    Returns:
+        CompactLedger: compact.
+    """
+    key = (store.db_path, ledger)
+    with _shared_lock:
+        cached = _shared.get(key)
+        if cached is None or cached.version <= compact.version:
+            _shared[key] = compact
+    return compact
+
+
+def shared(store, ledger:str, version:int=None) -> CompactLedger:
+    """
+    A ledger of the local store at its current version, built once per version for the whole process.
+
+    Args:
+        store: Local storage backend, see ledger_store.SQLiteBackend.
+        ledger (str): 'spendings' or 'income'.
+        version (int): Version the caller already read, to skip reading it again.
+    """
+    version = store.version(ledger) if version is None else version
+    with _shared_lock:
+        cached = _shared.get((store.db_path, ledger))
+    if cached is not None and cached.version == version:
+        telemetry.cache("ledger.shared", hits=1)
+        return cached
+    telemetry.cache("ledger.shared", misses=1)
+    with telemetry.timer("store.fetch"):
+        version, rows = store.snapshot(ledger)
+    with telemetry.timer("ledger.build"):
+        compact = CompactLedger.from_rows(rows, version)
+    return publish(store, ledger, compact)
+
+
+def memory_report() -> list:
+    """
+    Rows and bytes of every ledger shared in the process, with the bytes per ROWS_PER_REPORT rows.
+
+    Returns:
+        list: {"Store", "Ledger", "Version", "Rows", "Bytes", "Frame Bytes", "Bytes per 100k Rows"} dicts.
+    """
+    with _shared_lock:
+        ledgers = list(_shared.items())
+    report = []
+    for (db_path, ledger), compact in ledgers:
+        size = compact.nbytes()
+        report.append({
+            "Store": db_path,
+            "Ledger": ledger,
+            "Version": compact.version,
+            "Rows": len(compact),
+            "Bytes": size,
+            "Frame Bytes": compact.frame_nbytes(),
+            "Bytes per 100k Rows": round(size / len(compact) * ROWS_PER_REPORT) if len(compact) else None,
+        })
+    return report
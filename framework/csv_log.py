@@ -0,0 +1,157 @@
+#CSV import and export of the ledgers
+import csv
+import time
+import numpy as np
+import pandas as pd
+from framework import ledger_store, settings_store, sheet
+
+CSV_COLUMNS = ["Amount", "Date", "Type", "Comments", "Currency"]
+CHUNK_SIZE = 10_000
+MAX_ERRORS = 100
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+def read_chunks(path:str, chunk_size:int=CHUNK_SIZE):
+    """
+    Read a CSV file chunk_size rows at a time.
+
+    Args:
+        path (str): CSV file with at least the Amount, Date and Type columns,
+            and optionally Comments and Currency.
+        chunk_size (int): Rows per chunk.
+
+    Yields:
+        pd.DataFrame: Chunks of raw string cells, indexed by line number in the file.
+    """
+    with pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, skipinitialspace=True) as reader:
+        for chunk in reader:
+            chunk.index = chunk.index + 2  # Line 1 is the header.
+            yield chunk
+
+
+def _parse_dates(values:pd.Series) -> pd.Series:
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for date_format in DATE_FORMATS:
+        missing = dates.isna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(values[missing], format=date_format, errors="coerce")
+    return dates
+
+
+def validate_chunk(chunk:pd.DataFrame, currency:str="USD", types:list=None) -> tuple:
+    """
+    Validate a chunk in vectorized passes.
+
+    Amounts are kept in their own currency, to be converted at the rate of
+    their date when the ledger is read, so importing never calls the
+    exchange rates API.
+
+    Args:
+        chunk (pd.DataFrame): Chunk as yielded by read_chunks.
+        currency (str): Currency of the rows without a Currency column.
+        types (list): Allowed transaction types, None to accept any.
+
+    Returns:
+        tuple: (rows ready to log as [amount, 'YYYY-MM-DD', type, comments, currency, rate date],
+                errors as (line, reason) tuples)
+    """
+    missing = [column for column in ("Amount", "Date", "Type") if column not in chunk]
+    if missing:
+        raise KeyError(f"Missing column(s): {', '.join(missing)}")
+    amounts = pd.to_numeric(chunk["Amount"].str.replace(",", ""), errors="coerce")
+    dates = _parse_dates(chunk["Date"].str.strip())
+    transaction_types = chunk["Type"].str.strip()
+    comments = chunk["Comments"] if "Comments" in chunk else pd.Series("", index=chunk.index)
+    currencies = chunk["Currency"].str.strip().str.upper().replace("", currency) if "Currency" in chunk else pd.Series(currency, index=chunk.index)
+
+    reasons = pd.Series("", index=chunk.index)
+    reasons[~currencies.isin(settings_store.currencies())] = "unknown currency"
+    reasons[transaction_types == ""] = "missing type"
+    if types is not None:
+        reasons[(transaction_types != "") & ~transaction_types.isin(types)] = "unknown type"
+    reasons[dates.isna()] = "invalid date"
+    reasons[amounts < 0] = "negative amount"
+    reasons[amounts.isna()] = "invalid amount"
+
+    valid = reasons == ""
+    days = dates[valid].dt.strftime("%Y-%m-%d").tolist()
+    rows = [
+        [amount, day, transaction_type, comment, row_currency, day]
+        for amount, day, transaction_type, comment, row_currency in zip(
+            np.round(amounts[valid].to_numpy(), 2).tolist(), days,
+            transaction_types[valid].tolist(), comments[valid].tolist(), currencies[valid].tolist()
+        )
+    ]
+    return rows, list(reasons[~valid].items())
+
+
+def import_csv(data_type:str, logger:sheet.SheetLogger, path:str, chunk_size:int=CHUNK_SIZE, currency:str="USD", types:list=None) -> dict:
+    """
+    Import a bank export into a ledger, one chunk at a time.
+
+    Memory stays constant whatever the size of the file: each chunk is read,
+    validated and logged with one batched append before the next one is read.
+
+    Args:
+        data_type (str): spendings or income.
+        logger (SheetLogger): Logger the rows are written to.
+        path (str): CSV file, see read_chunks.
+        chunk_size (int): Rows per chunk.
+        currency (str): Currency of the rows without a Currency column.
+        types (list): Allowed transaction types, None to accept any.
+
+    Returns:
+        dict:
+            - rows (int): Rows read.
+            - imported (int): Rows logged.
+            - rejected (int): Rows skipped.
+            - errors (list): (line, reason) of the first MAX_ERRORS rejected rows.
+            - chunks (int): Chunks processed.
+            - seconds (float), rows_per_second (float): Throughput.
+    """
+    if data_type not in ledger_store.LEDGERS:
+        raise KeyError("Invalid type of data, must be spendings or income.")
+    report = {"rows": 0, "imported": 0, "rejected": 0, "errors": [], "chunks": 0}
+    started = time.perf_counter()
+    for chunk in read_chunks(path, chunk_size):
+        rows, errors = validate_chunk(chunk, currency, types=types)
+        logger.log_rows(data_type, rows)
+        report["rows"] += len(chunk)
+        report["imported"] += len(rows)
+        report["rejected"] += len(errors)
+        report["errors"].extend(errors[:MAX_ERRORS - len(report["errors"])])
+        report["chunks"] += 1
+    report["seconds"] = time.perf_counter() - started
+    report["rows_per_second"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+def export_csv(data_type:str, logger:sheet.SheetLogger, path:str=None, chunk_size:int=CHUNK_SIZE, columns:list=CSV_COLUMNS) -> dict:
+    """
+    Stream a ledger to a CSV file without loading it into memory.
+
+    Args:
+        data_type (str): spendings or income.
+        logger (SheetLogger): Logger whose local store is exported.
+        path (str): Output file, database/<data_type>.csv by default.
+        chunk_size (int): Rows read from the store at a time.
+        columns (list): Ledger columns written, in order.
+
+    Returns:
+        dict: rows (int), path (str), seconds (float) and rows_per_second (float).
+    """
+    if data_type not in ledger_store.LEDGERS:
+        raise KeyError("Invalid type of data, must be spendings or income.")
+    path = path or f"database/{data_type}.csv"
+    indexes = [ledger_store.COLUMNS.index(column) for column in columns]
+    rows = 0
+    started = time.perf_counter()
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for chunk in logger.store.iter_chunks(data_type, chunk_size):
+            writer.writerows([row[i] for i in indexes] for row in chunk)
+            rows += len(chunk)
+    seconds = time.perf_counter() - started
+    return {"rows": rows, "path": path, "seconds": seconds, "rows_per_second": rows / seconds if seconds else 0.0}
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+PERIODS = {"month": "M", "quarter": "Q", "year": "Y"}
+
+
+class DateIndex:
+    """
+    Positions of a history sorted by date, with running totals of the amounts.
+
+    Built once per version of a ledger in O(n log n); afterwards a date range
+    is located by binary search, so selecting its k rows costs O(log n + k)
+    and summing its amounts O(log n). Rows with a missing date are left out.
+    """
+
+    def __init__(self, history:pd.DataFrame, amount_column:str="Amount"):
+        """
+        Args:
+            history (pd.DataFrame): History with a "Date" column, e.g. SheetLogger.fetch_*(True, as_frame=True).
+            amount_column (str): Column of the amounts to total, e.g. the amounts in the base currency.
+        """
+        dates = pd.to_datetime(history["Date"], errors="coerce").to_numpy(dtype="datetime64[ns]")
+        amounts = pd.to_numeric(history[amount_column], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+        valid = np.flatnonzero(~np.isnat(dates))
+        self.positions = valid[np.argsort(dates[valid], kind="stable")]
+        self.dates = dates[self.positions]
+        self.cumulative = np.concatenate([[0.0], np.cumsum(amounts[self.positions])])
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _bounds(self, start=None, end=None) -> tuple:
+        """
+        Slice of the sorted arrays holding the dates from start to end, both included.
+        """
+        first = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start)), side="left"))
+        last = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end)), side="right"))
+        return first, max(first, last)
+
+    def range(self, start=None, end=None, sheet_order:bool=True) -> np.ndarray:
+        """
+        Positions of the rows dated from start to end (both included, None for no bound).
+
+        Args:
+            sheet_order (bool): Return the positions in sheet order instead of date order.
+        """
+        first, last = self._bounds(start, end)
+        positions = self.positions[first:last]
+        return np.sort(positions) if sheet_order else positions
+
+    def select(self, history:pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+        """
+        Rows of the history the index was built from, dated from start to end, in sheet order.
+        """
+        return history.iloc[self.range(start, end)]
+
+    def total(self, start=None, end=None) -> float:
+        """
+        Sum of the amounts dated from start to end.
+        """
+        first, last = self._bounds(start, end)
+        return float(self.cumulative[last] - self.cumulative[first])
+
+    def count(self, start=None, end=None) -> int:
+        first, last = self._bounds(start, end)
+        return last - first
+
+    def summary(self, period:str="month", start=None, end=None) -> pd.DataFrame:
+        """
+        Total and count of the amounts of every month, quarter or year between start and end.
+
+        Each period costs one binary search, so the whole summary is O(p log n)
+        for p periods.
+
+        Args:
+            period (str): 'month', 'quarter' or 'year'.
+
+        Returns:
+            pd.DataFrame: "Total" and "Count" indexed by "Period" (pd.Period), empty periods included.
+        """
+        first, last = self._bounds(start, end)
+        if first == last:
+            return pd.DataFrame({"Total": [], "Count": []}, index=pd.PeriodIndex([], freq=PERIODS[period], name="Period"))
+        periods = pd.period_range(pd.Timestamp(self.dates[first]), pd.Timestamp(self.dates[last - 1]), freq=PERIODS[period], name="Period")
+        edges = np.searchsorted(self.dates, periods.start_time.to_numpy(dtype="datetime64[ns]"), side="left")
+        edges = np.clip(np.append(edges, last), first, last)
+        edges[0] = first
+        return pd.DataFrame({"Total": np.diff(self.cumulative[edges]), "Count": np.diff(edges)}, index=periods)
+
+
+def period_summary(spendings:DateIndex, income:DateIndex, period:str="month", start=None, end=None) -> pd.DataFrame:
+    """
+    Spendings, income and net income of every period, see DateIndex.summary.
+
+    Returns:
+        pd.DataFrame: "Spendings", "Income" and "Net Income" indexed by "Period" as strings.
+    """
+    frame = pd.DataFrame({
+        "Spendings": spendings.summary(period, start, end)["Total"],
+        "Income": income.summary(period, start, end)["Total"],
+    }).fillna(0.0).sort_index()
+    frame["Net Income"] = frame["Income"] - frame["Spendings"]
+    frame.index = frame.index.astype(str)
+    return frame
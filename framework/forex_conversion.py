@@ -1,29 +1,213 @@
+import json
+import os
+import threading
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
 import requests
 import streamlit as st
+from framework import settings_store, telemetry
 
-def convert_currency(amount, original_currency, to_currency, api_key=None):
-    """
-    Convert an amount from one currency to another using the Exchangerates API.
+CURRENCIES_PATH = "settings/currencies.json"
+RATES_CACHE_PATH = "database/rates.json"
+HISTORICAL_RATES_CACHE_PATH = "database/historical_rates.json"
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 3600
 
-    :param amount: The amount to convert.
-    :param from_currency: The currency code to convert from (e.g., 'USD').
-    :param to_currency: The currency code to convert to (e.g., 'EUR').
-    :param api_key: Your API key for the Exchangerates API.
-    :return: The converted amount.
+# One pooled session for the whole process, so conversions reuse the TLS connection.
+_session = requests.Session()
+_session.hooks["response"].append(telemetry.record_response)
+
+
+class ExchangeRatesApiProvider:
+    """
+    Fetch the latest rates from the Exchangerates API.
     """
-    if api_key is None:
-        api_key = st.secrets.forex_api.api_key
-    url = f"https://api.exchangeratesapi.io/v1/latest?access_key={api_key}&symbols={original_currency},{to_currency}"
 
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+    def __init__(self, api_key:str=None, session:requests.Session=None, timeout:float=10):
+        """
+        Args:
+            api_key (str): Your API key for the Exchangerates API, defaults to st.secrets.forex_api.api_key.
+            session (requests.Session): Session to send requests with, defaults to the shared pool.
+            timeout (float): Seconds to wait for the API before giving up.
+        """
+        self.api_key = api_key
+        self.session = session if session is not None else _session
+        self.timeout = timeout
 
+    @telemetry.timed("forex.fetch_rates")
+    def fetch_rates(self, symbols:list[str]) -> dict:
+        """
+        Fetch the rates of every symbol relative to the API's base currency in one request.
+
+        Returns:
+            dict: Rate of each currency code.
+        """
+        api_key = self.api_key if self.api_key is not None else st.secrets.forex_api.api_key
+        url = f"https://api.exchangeratesapi.io/v1/latest?access_key={api_key}&symbols={','.join(symbols)}"
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"Failed to connect to the Exchangerates API: {e}")
+        if "error" in data:
+            raise ValueError(f"API error: {data['error']['info']}")
+        return data["rates"]
+
+    @telemetry.timed("forex.fetch_timeseries")
+    def fetch_timeseries(self, start_date:date, end_date:date, symbols:list[str]) -> dict:
+        """
+        Fetch daily rates between two dates (at most 365 days apart) in one request.
+
+        Returns:
+            dict: {'YYYY-MM-DD': {currency code: rate}}.
+        """
+        api_key = self.api_key if self.api_key is not None else st.secrets.forex_api.api_key
+        url = (f"https://api.exchangeratesapi.io/v1/timeseries?access_key={api_key}"
+               f"&start_date={start_date:%Y-%m-%d}&end_date={end_date:%Y-%m-%d}&symbols={','.join(symbols)}")
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"Failed to connect to the Exchangerates API: {e}")
         if "error" in data:
             raise ValueError(f"API error: {data['error']['info']}")
+        return data["rates"]
+
+
+class FileRateProvider:
+    """
+    Offline stand-in provider reading rates from a JSON file ({"rates": {"USD": 1.08, ...}}).
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+
+    def fetch_rates(self, symbols:list[str]) -> dict:
+        with open(self.path, "r") as file:
+            rates = json.load(file)["rates"]
+        return {symbol: rates[symbol] for symbol in symbols if symbol in rates}
 
-        rates = data['rates']
+    def fetch_timeseries(self, start_date:date, end_date:date, symbols:list[str]) -> dict:
+        """
+        Read dated rates from the file's "historical" section ({"YYYY-MM-DD": {...}}).
+        """
+        with open(self.path, "r") as file:
+            historical = json.load(file).get("historical", {})
+        return {
+            day: {symbol: rates[symbol] for symbol in symbols if symbol in rates}
+            for day, rates in historical.items()
+            if f"{start_date:%Y-%m-%d}" <= day <= f"{end_date:%Y-%m-%d}"
+        }
+
+
+class _Cooldown:
+    """
+    Remembers a failed request so it is not sent again on every rerun.
+
+    The request waits retry_delay seconds after a failure, twice as long after
+    each further failure in a row, up to max_retry_delay.
+    """
+
+    def __init__(self, retry_delay:float=RETRY_DELAY, max_retry_delay:float=MAX_RETRY_DELAY):
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.delay = 0
+        self.retry_at = 0
+        self.error = None
+
+    def waiting(self) -> bool:
+        """
+        Whether the last request failed and must not be repeated yet.
+        """
+        return self.error is not None and time.time() < self.retry_at
+
+    def failed(self, error:Exception) -> None:
+        self.delay = min(self.max_retry_delay, self.delay * 2) if self.delay else self.retry_delay
+        self.retry_at = time.time() + self.delay
+        self.error = error
+
+    def succeeded(self) -> None:
+        self.delay = 0
+        self.error = None
+
+
+class RateTable:
+    """
+    Rates of every currency in settings/currencies.json, cached in memory and on disk.
+
+    The whole table is fetched with a single request and reused by every
+    conversion until it is older than ttl seconds. A failed request raises
+    the same error again, without a request, until its cooldown is over.
+    """
+
+    def __init__(self, provider=None, ttl:float=3600, cache_path:str=RATES_CACHE_PATH, currencies_path:str=CURRENCIES_PATH):
+        """
+        Args:
+            provider: Object with a fetch_rates(symbols) method, defaults to ExchangeRatesApiProvider().
+            ttl (float): Seconds a fetched table stays valid.
+            cache_path (str): JSON file the table is persisted to, None to keep it in memory only.
+            currencies_path (str): JSON file listing the currencies to fetch.
+        """
+        self.provider = provider if provider is not None else ExchangeRatesApiProvider()
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self.currencies_path = currencies_path
+        self.lock = threading.Lock()
+        self.table = None
+        self.cooldown = _Cooldown()
+
+    def _fresh(self, table:dict) -> bool:
+        return table is not None and time.time() - table["timestamp"] < self.ttl
+
+    def _load_disk(self) -> dict:
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _save_disk(self, table:dict) -> None:
+        if self.cache_path is None:
+            return
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(table, file)
+        os.replace(temp_path, self.cache_path)
+
+    def rates(self) -> dict:
+        """
+        Return the rate table, fetching it only when the cached one has expired.
+
+        Returns:
+            dict: Rate of each currency code relative to the provider's base currency.
+        """
+        with self.lock:
+            telemetry.cache("forex.rate_table", *((1, 0) if self._fresh(self.table) else (0, 1)))
+            if not self._fresh(self.table):
+                table = self._load_disk()
+                if not self._fresh(table):
+                    if self.cooldown.waiting():
+                        telemetry.count("forex.requests_skipped")
+                        raise self.cooldown.error.with_traceback(None)
+                    symbols = list(dict.fromkeys(settings_store.load(self.currencies_path)["currencies"]))
+                    try:
+                        table = {"timestamp": time.time(), "rates": self.provider.fetch_rates(symbols)}
+                    except (ValueError, ConnectionError) as e:
+                        self.cooldown.failed(e)
+                        raise
+                    self.cooldown.succeeded()
+                    self._save_disk(table)
+                self.table = table
+            return self.table["rates"]
+
+    def convert(self, amount:float, original_currency:str, to_currency:str) -> float:
+        rates = self.rates()
         from_rate = rates.get(original_currency)
         to_rate = rates.get(to_currency)
 
@@ -31,10 +215,226 @@ def convert_currency(amount, original_currency, to_currency, api_key=None):
             raise ValueError(f"Conversion rate for {original_currency} or {to_currency} not found.")
 
         # Convert using the rates relative to the base currency
-        converted_amount = (amount / from_rate) * to_rate
-        return converted_amount
+        return (amount / from_rate) * to_rate
+
+
+class HistoricalRateTable:
+    """
+    Daily rates held as a date x currency matrix, for converting transactions at their own date.
+
+    Past rates never change, so every fetched day is persisted and only days
+    missing from the table are requested, a year per request. Days the
+    provider has no rates for (weekends, holidays) are kept with the rates of
+    the day before, and without rates when no earlier day is known, so they
+    are not requested again. A failed request is kept in fetch_error and not
+    repeated until its cooldown is over; the dates it was for have no rate
+    meanwhile. Dates from today onwards are priced with the latest rates of
+    the RateTable.
+    """
+
+    def __init__(self, provider=None, latest:RateTable=None, cache_path:str=HISTORICAL_RATES_CACHE_PATH, currencies_path:str=CURRENCIES_PATH):
+        """
+        Args:
+            provider: Object with a fetch_timeseries(start_date, end_date, symbols) method.
+            latest (RateTable): Table used for today's and future dates.
+            cache_path (str): JSON file the dated rates are persisted to, None to keep them in memory only.
+            currencies_path (str): JSON file listing the currencies to fetch.
+        """
+        self.provider = provider if provider is not None else ExchangeRatesApiProvider()
+        self.latest = latest if latest is not None else RateTable(self.provider, currencies_path=currencies_path)
+        self.cache_path = cache_path
+        self.currencies_path = currencies_path
+        self.lock = threading.Lock()
+        self.currencies = pd.Index(list(dict.fromkeys(settings_store.load(currencies_path)["currencies"])))
+        self.dates = np.array([], dtype="datetime64[D]")
+        self.matrix = np.empty((0, len(self.currencies)))
+        self.cooldown = _Cooldown()
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, "r") as file:
+                self._merge(json.load(file))
+
+    def _merge(self, rates_by_day:dict) -> None:
+        """
+        Merge {'YYYY-MM-DD': {currency: rate}} into the sorted matrix.
+        """
+        if not rates_by_day:
+            return
+        days = np.array(sorted(rates_by_day), dtype="datetime64[D]")
+        rows = np.full((len(days), len(self.currencies)), np.nan)
+        for i, day in enumerate(sorted(rates_by_day)):
+            rates = pd.Series(rates_by_day[day], dtype=float)
+            columns = self.currencies.get_indexer(rates.index)
+            rows[i, columns[columns >= 0]] = rates.to_numpy()[columns >= 0]
+        dates = np.concatenate([self.dates, days])
+        matrix = np.concatenate([self.matrix, rows])
+        dates, first = np.unique(dates[::-1], return_index=True)
+        self.dates = dates
+        self.matrix = matrix[::-1][first]
+
+    def _save_disk(self) -> None:
+        if self.cache_path is None:
+            return
+        table = {
+            str(day): {currency: rate for currency, rate in zip(self.currencies, row) if not np.isnan(rate)}
+            for day, row in zip(self.dates, self.matrix)
+        }
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(table, file)
+        os.replace(temp_path, self.cache_path)
+
+    @property
+    def fetch_error(self) -> Exception:
+        """
+        Error of the last failed request, None once a request succeeds.
+        """
+        return self.cooldown.error
+
+    def load(self, dates) -> None:
+        """
+        Make sure the table holds every past date in dates, fetching the missing ones by the year.
+
+        A failed request is not raised but kept in fetch_error, see the class docstring.
+        """
+        today = np.datetime64(date.today(), "D")
+        wanted = np.unique(np.asarray(dates, dtype="datetime64[D]"))
+        with self.lock:
+            missing = wanted[(wanted < today) & ~np.isin(wanted, self.dates)]
+            telemetry.cache("forex.historical_rates", len(wanted) - len(missing), len(missing))
+            if len(missing) == 0:
+                return
+            if self.cooldown.waiting():
+                telemetry.count("forex.requests_skipped")
+                return
+            fetched = {}
+            covered = []
+            start = missing[0]
+            try:
+                while start <= missing[-1]:
+                    end = min(start + np.timedelta64(364, "D"), missing[-1])
+                    chunk = missing[(missing >= start) & (missing <= end)]
+                    if len(chunk):
+                        # Reach back a week so a weekend or holiday has an earlier day to take rates from.
+                        fetched.update(self.provider.fetch_timeseries(
+                            (chunk[0] - np.timedelta64(7, "D")).astype(date), chunk[-1].astype(date), list(self.currencies)
+                        ))
+                        covered.append(chunk)
+                    start = end + np.timedelta64(1, "D")
+                self.cooldown.succeeded()
+            except (ValueError, ConnectionError) as e:
+                self.cooldown.failed(e)
+            self._merge(fetched)
+            # Only the days of successful requests are known to have no rates of their own.
+            covered = np.concatenate(covered) if covered else missing[:0]
+            absent = covered[~np.isin(covered, self.dates)]
+            previous = np.searchsorted(self.dates, absent, side="right") - 1
+            self._merge({
+                str(day): {} if row < 0 else dict(zip(self.currencies, self.matrix[row]))
+                for day, row in zip(absent, previous)
+            })
+            self._save_disk()
+
+    def convert_bulk(self, amounts, currencies, dates, to_currency:str="USD") -> np.ndarray:
+        """
+        Convert a column of amounts, each at the rate of its own date, in one vectorized pass.
+
+        Args:
+            amounts: Amounts to convert.
+            currencies: Currency code of each amount.
+            dates: Date of each amount (dates, datetimes or 'YYYY-MM-DD' strings).
+            to_currency (str): Currency to convert to.
+
+        Returns:
+            np.ndarray: Converted amounts, NaN where no rate is known for the currency
+                at that date, so one unpublished currency does not hold up the others.
+                Past dates are converted at the rates of their day or of the last day
+                before it with rates, never at later rates.
+
+        Raises:
+            ValueError: If to_currency has no rates.
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        days = pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]")
+        self.load(days)
+        columns = self.currencies.get_indexer(pd.Index(currencies))
+        to_column = self.currencies.get_loc(to_currency) if to_currency in self.currencies else -1
+        if to_column < 0:
+            raise ValueError(f"Conversion rate for {to_currency} not found.")
+
+        today = np.datetime64(date.today(), "D")
+        past = days < today
+        if past.all():
+            latest = np.full(len(self.currencies), np.nan)
+        else:
+            latest = pd.Series(self.latest.rates(), dtype=float).reindex(self.currencies).to_numpy()
+        rows = np.searchsorted(self.dates, days, side="right") - 1
+        # Dates before the first day of the table have no rate.
+        history = np.where((rows >= 0)[:, None], self.matrix[np.clip(rows, 0, None)], np.nan) if len(self.dates) else np.full((len(days), len(self.currencies)), np.nan)
+        from_rates = np.where(past, history[np.arange(len(days)), columns], latest[columns])
+        from_rates[columns < 0] = np.nan
+        to_rates = np.where(past, history[:, to_column], latest[to_column])
+        same = pd.Index(currencies).to_numpy() == to_currency
+        return np.where(same, amounts, amounts / from_rates * to_rates)
+
+
+_rate_tables = {}
+_rate_tables_lock = threading.Lock()
+
+
+def get_rate_table(api_key:str=None) -> RateTable:
+    """
+    Return the process-wide rate table for an API key (None for the key in st.secrets).
+    """
+    with _rate_tables_lock:
+        if api_key not in _rate_tables:
+            _rate_tables[api_key] = RateTable(ExchangeRatesApiProvider(api_key))
+        return _rate_tables[api_key]
+
+
+_historical_rate_table = None
+
 
-    except requests.exceptions.RequestException as e:
-        raise ConnectionError(f"Failed to connect to the Exchangerates API: {e}")
+def get_historical_rate_table() -> HistoricalRateTable:
+    """
+    Return the process-wide historical rate table.
+    """
+    global _historical_rate_table
+    with _rate_tables_lock:
+        if _historical_rate_table is None:
+            latest = _rate_tables.setdefault(None, RateTable(ExchangeRatesApiProvider()))
+            _historical_rate_table = HistoricalRateTable(latest.provider, latest)
+        return _historical_rate_table
+
+
+def convert_currencies(amounts, currencies, dates, to_currency:str="USD") -> np.ndarray:
+    """
+    Convert a column of (amount, currency, date) at each date's rate with one table load.
+
+    :param amounts: The amounts to convert.
+    :param currencies: The currency code of each amount.
+    :param dates: The date of each amount.
+    :param to_currency: The currency code to convert to.
+    :return: The converted amounts, NaN where no rate is known.
+    """
+    try:
+        return get_historical_rate_table().convert_bulk(amounts, currencies, dates, to_currency)
+    except ValueError as e:
+        raise ValueError(f"Error in currency conversion: {e}")
+
+
+def convert_currency(amount, original_currency, to_currency, api_key=None):
+    """
+    Convert an amount from one currency to another using the Exchangerates API.
+
+    Rates come from a cached table shared by every conversion in the process.
+
+    :param amount: The amount to convert.
+    :param from_currency: The currency code to convert from (e.g., 'USD').
+    :param to_currency: The currency code to convert to (e.g., 'EUR').
+    :param api_key: Your API key for the Exchangerates API.
+    :return: The converted amount.
+    """
+    try:
+        return get_rate_table(api_key).convert(amount, original_currency, to_currency)
     except ValueError as e:
-        raise ValueError(f"Error in currency conversion: {e}")
\ No newline at end of file
+        raise ValueError(f"Error in currency conversion: {e}")
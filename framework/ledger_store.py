@@ -0,0 +1,944 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from framework import rate_limit
+
+LEDGERS = ("spendings", "income")
+MAX_APPEND_ROWS = 10_000
+COLUMNS = ["Number", "Amount", "Date", "Type", "Comments", "Currency", "Rate Date"]
+_SQL_COLUMNS = ["number", "amount", "date", "type", "comments", "currency", "rate_date"]
+BASE_CURRENCY = "USD"
+BASE_COLUMN = f"Amount {BASE_CURRENCY}"
+# Rows entered without a currency (every row written before currencies were kept) are in the base currency.
+_IN_BASE = f"COALESCE(currency, '') IN ('', '{BASE_CURRENCY}')"
+ARCHIVE = "archive"
+ARCHIVE_COLUMNS = ["Ledger", "Year", "Rollup", "Key", "Amount", "Count"]
+
+
+def cell_value(value):
+    """
+    Normalise a value before it is written to a ledger.
+
+    Dates are stored the same way the Google Sheet stores them ('YYYY-MM-DD').
+    """
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def pad_row(row:list) -> list:
+    """
+    Complete a row with empty cells up to the last ledger column.
+    """
+    return list(row[:len(COLUMNS)]) + [None] * (len(COLUMNS) - len(row))
+
+
+def base_amount(amount, currency):
+    """
+    Amount of a row in BASE_CURRENCY when it was entered in it, None while it waits for a conversion.
+    """
+    return amount if currency in (None, "", BASE_CURRENCY) else None
+
+
+def current_year() -> str:
+    return str(date.today().year)
+
+
+def partition_of(day) -> str:
+    """
+    Year partition a row dated day is filed in ('YYYY').
+
+    Rows without a readable date are filed in the current year. A row stays
+    in its partition when its date is edited later.
+    """
+    year = str(cell_value(day) or "")[:4]
+    return year if len(year) == 4 and year.isdigit() else current_year()
+
+
+def is_closed(partition:str) -> bool:
+    """
+    Whether a partition belongs to a past year, whose rows are summarised in the archive.
+    """
+    return partition < current_year()
+
+
+def partition_key(ledger:str, partition:str) -> str:
+    """
+    Replica key of one partition of a ledger, e.g. 'spendings:2024'.
+    """
+    return f"{ledger}:{partition}"
+
+
+def split_key(key:str) -> tuple:
+    """
+    (ledger, partition) of a replica key, partition being None for a whole ledger.
+    """
+    ledger, _, partition = key.partition(":")
+    return ledger, partition or None
+
+
+class SQLiteBackend:
+    """
+    A local SQLite copy of the ledgers, used as the primary read path.
+
+    Each ledger is a table whose rows are filed in year partitions, one
+    worksheet each on Google Sheets. Rows are kept in sheet order, partition
+    after partition, so the n-th row of a ledger is row n + 1 of the
+    partitions laid end to end (row 1 being the header).
+
+    Amounts are kept as entered, with their currency and the date of the
+    rate to convert them at. Their value in BASE_CURRENCY is kept next to
+    them for the rollups; for other currencies it is filled in later, in
+    bulk, by set_base.
+
+    Writes made with replicate=True also record the operation in an outbox
+    table within the same transaction, so a write acknowledged locally is
+    never lost before the Replicator has applied it to Google Sheets. They are
+    recorded per partition, addressed by the rows of the partition's worksheet.
+    Writes the replica rejects for good are moved to a dead_letters table,
+    and the worksheet they were meant for is rebuilt from the local rows.
+    """
+
+    def __init__(self, db_path:str="database/ledger.db"):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file.
+        """
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, method TEXT, ledger TEXT, args TEXT)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letters (id INTEGER PRIMARY KEY, method TEXT, ledger TEXT, args TEXT, error TEXT, failed_at TEXT)"
+            )
+            for ledger in LEDGERS:
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {ledger} ("
+                    "position INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "number INTEGER, amount REAL, date TEXT, type TEXT, comments TEXT, "
+                    "currency TEXT, rate_date TEXT, year TEXT, base REAL)"
+                )
+                if "currency" not in [column[1] for column in self.connection.execute(f"PRAGMA table_info({ledger})")]:
+                    # Databases created before currencies were kept: every amount is in the base currency.
+                    for column, kind in (("currency", "TEXT"), ("rate_date", "TEXT"), ("base", "REAL")):
+                        self.connection.execute(f"ALTER TABLE {ledger} ADD COLUMN {column} {kind}")
+                    self.connection.execute(f"UPDATE {ledger} SET base = amount")
+                    self._bump(ledger)
+                if "year" not in [column[1] for column in self.connection.execute(f"PRAGMA table_info({ledger})")]:
+                    # Databases created before partitioning: file every row by the year of its date.
+                    self.connection.execute(f"ALTER TABLE {ledger} ADD COLUMN year TEXT")
+                    self.connection.execute(
+                        f"UPDATE {ledger} SET year = CASE WHEN substr(date, 1, 4) GLOB '[0-9][0-9][0-9][0-9]' "
+                        "THEN substr(date, 1, 4) ELSE ? END",
+                        (current_year(),),
+                    )
+                    self._bump(ledger)
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {ledger}_year ON {ledger} (year, position)")
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {ledger}_unconverted ON {ledger} (position) WHERE base IS NULL")
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS rollup_{ledger} ("
+                    "kind TEXT, key TEXT, amount REAL, count INTEGER, PRIMARY KEY (kind, key))"
+                )
+        for ledger in LEDGERS:
+            if not self.rollups_consistent(ledger):
+                self.rebuild_rollups(ledger)
+
+    def is_hydrated(self, ledger:str) -> bool:
+        """
+        Check whether the ledger has been loaded from Google Sheets at least once.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (f"hydrated:{ledger}",)).fetchone()
+        return row is not None
+
+    def version(self, ledger:str) -> int:
+        """
+        Write counter of a ledger, bumped on every change made through any connection.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (f"version:{ledger}",)).fetchone()
+        return int(row[0]) if row is not None else 0
+
+    def _bump(self, ledger:str) -> None:
+        self.connection.execute(
+            "INSERT INTO meta (key, value) VALUES (?, '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+            (f"version:{ledger}",),
+        )
+
+    def fetch(self, ledger:str) -> list:
+        """
+        Fetch every row of a ledger in sheet order.
+
+        Returns:
+            list: List of records, keyed like gspread's get_all_records, plus the
+                amount in the base currency under BASE_COLUMN (None until converted).
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(_SQL_COLUMNS)}, base FROM {ledger} ORDER BY year, position"
+            ).fetchall()
+        return [dict(zip(COLUMNS + [BASE_COLUMN], row)) for row in rows]
+
+    def snapshot(self, ledger:str) -> tuple:
+        """
+        Read every row of a ledger together with the version they are at.
+
+        Returns:
+            tuple: (version, rows as (Number, Amount, Date, Type, Comments, Currency, Rate Date, base) tuples in sheet order)
+        """
+        with self.lock:
+            return self.version(ledger), self.connection.execute(
+                f"SELECT {', '.join(_SQL_COLUMNS)}, base FROM {ledger} ORDER BY year, position"
+            ).fetchall()
+
+    def iter_chunks(self, ledger:str, chunk_size:int=10_000):
+        """
+        Stream the rows of a ledger in sheet order, chunk_size rows at a time.
+
+        Each chunk is read by its own keyset query, so memory stays constant
+        and writes are not blocked between chunks.
+
+        Yields:
+            list: Rows as [Number, Amount, Date, Type, Comments, Currency, Rate Date] lists.
+        """
+        key = ("", 0)
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    f"SELECT year, position, {', '.join(_SQL_COLUMNS)} FROM {ledger} "
+                    "WHERE (year, position) > (?, ?) ORDER BY year, position LIMIT ?",
+                    key + (chunk_size,),
+                ).fetchall()
+            if not rows:
+                return
+            key = tuple(rows[-1][:2])
+            yield [list(row[2:]) for row in rows]
+
+    def count(self, ledger:str) -> int:
+        """
+        Number of rows in a ledger, read from a counter maintained on every write.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (f"rows:{ledger}",)).fetchone()
+            if row is None:
+                return self.connection.execute(f"SELECT COUNT(*) FROM {ledger}").fetchone()[0]
+        return int(row[0])
+
+    def partition_count(self, ledger:str, partition:str) -> int:
+        """
+        Number of rows filed in one partition of a ledger.
+        """
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {ledger} WHERE year = ?", (partition,)).fetchone()[0]
+
+    def partition_sizes(self, ledger:str) -> list:
+        """
+        (partition, number of rows) of every partition of a ledger, in sheet order.
+        """
+        with self.lock:
+            return self.connection.execute(f"SELECT year, COUNT(*) FROM {ledger} GROUP BY year ORDER BY year").fetchall()
+
+    def last_partition(self, ledger:str) -> str:
+        """
+        Latest partition holding rows of a ledger, None when it is empty.
+        """
+        with self.lock:
+            return self.connection.execute(f"SELECT MAX(year) FROM {ledger}").fetchone()[0]
+
+    def _locate(self, ledger:str) -> list:
+        """
+        (position, partition, row of the partition's worksheet) of every row, in sheet order.
+        """
+        located = []
+        rows = {}
+        for position, partition in self.connection.execute(f"SELECT position, year FROM {ledger} ORDER BY year, position"):
+            rows[partition] = rows.get(partition, 1) + 1
+            located.append((position, partition, rows[partition]))
+        return located
+
+    def _relocate(self, ledger:str, rows:set, numbers:dict) -> dict:
+        """
+        Find rows again by the Number of the transaction they held, as other writes may have moved them since.
+
+        Args:
+            rows (set): Rows addressed by worksheet row (1-based, row 1 being the header).
+            numbers (dict): Number each row held; rows without one are kept as they are.
+
+        Returns:
+            dict: Current row of each row, None when its transaction was deleted since.
+
+        Raises:
+            ValueError: If a transaction moved and its Number is held by several rows.
+        """
+        held = [number for number, in self.connection.execute(f"SELECT number FROM {ledger} ORDER BY year, position")]
+        found = {}
+        for row, number in enumerate(held, start=2):
+            found.setdefault(number, []).append(row)
+        relocated = {}
+        for row in rows:
+            number = numbers.get(row)
+            if number is None or (2 <= row < len(held) + 2 and held[row - 2] == number):
+                relocated[row] = row
+            elif len(found.get(number, [])) > 1:
+                raise ValueError(f"Transaction {number} moved and its number is used by several rows, reload before saving.")
+            else:
+                relocated[row] = found[number][0] if number in found else None
+        return relocated
+
+    def _set_count(self, ledger:str, count:int) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"rows:{ledger}", str(count)))
+
+    def next_number(self, ledger:str) -> int:
+        """
+        Number for the next transaction: one past the highest number ever stored, so
+        numbers stay unique after rows are deleted.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (f"next:{ledger}",)).fetchone()
+            if row is None:
+                return (self.connection.execute(f"SELECT MAX(number) FROM {ledger}").fetchone()[0] or 0) + 1
+        return int(row[0])
+
+    def _set_next_number(self, ledger:str, rows:list[list]=None) -> None:
+        if rows is None:
+            number = 1
+        else:
+            numbers = [row[0] for row in rows if isinstance(row[0], (int, float))]
+            number = max([self.next_number(ledger)] + [int(n) + 1 for n in numbers])
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"next:{ledger}", str(number)))
+
+    def _rollup(self, ledger:str, rows:list, sign:int) -> None:
+        """
+        Add (sign=1) or remove (sign=-1) rows' contributions to the rollup tables.
+
+        Args:
+            rows (list): (amount in the base currency, date, type) of each row.
+        """
+        deltas = {}
+        for amount, day, transaction_type in rows:
+            try:
+                amount = float(amount)
+            except (TypeError, ValueError):
+                amount = 0.0
+            day = str(day or "")[:10]
+            for key in (("total", ""), ("day", day), ("month", day[:7]), ("type", str(transaction_type or ""))):
+                delta = deltas.setdefault(key, [0.0, 0])
+                delta[0] += sign * amount
+                delta[1] += sign
+        self.connection.executemany(
+            f"INSERT INTO rollup_{ledger} (kind, key, amount, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(kind, key) DO UPDATE SET amount = amount + excluded.amount, count = count + excluded.count",
+            [(kind, key, amount, count) for (kind, key), (amount, count) in deltas.items()],
+        )
+        self.connection.execute(f"DELETE FROM rollup_{ledger} WHERE count <= 0 AND kind != 'total'")
+
+    def _rebuild_rollups(self, ledger:str) -> None:
+        self.connection.execute(f"DELETE FROM rollup_{ledger}")
+        self.connection.execute(
+            f"INSERT INTO rollup_{ledger} (kind, key, amount, count) "
+            f"SELECT 'total', '', COALESCE(SUM(base), 0), COUNT(*) FROM {ledger}"
+        )
+        for kind, key in (("day", "substr(date, 1, 10)"), ("month", "substr(date, 1, 7)"), ("type", "type")):
+            self.connection.execute(
+                f"INSERT INTO rollup_{ledger} (kind, key, amount, count) "
+                f"SELECT '{kind}', COALESCE({key}, ''), COALESCE(SUM(base), 0), COUNT(*) FROM {ledger} GROUP BY 2"
+            )
+
+    def rebuild_rollups(self, ledger:str) -> None:
+        """
+        Recompute the rollup tables of a ledger from every row.
+        """
+        with self.lock, self.connection:
+            self._rebuild_rollups(ledger)
+
+    def rollups_consistent(self, ledger:str) -> bool:
+        """
+        Cheap corruption check: the rollup row count must match the ledger's row count.
+        """
+        with self.lock:
+            row = self.connection.execute(f"SELECT count FROM rollup_{ledger} WHERE kind = 'total'").fetchone()
+        return row is not None and row[0] == self.count(ledger)
+
+    def rollups(self, ledger:str) -> dict:
+        """
+        Materialized totals of a ledger in the base currency, kept up to date on every write.
+
+        Rows waiting for a conversion are counted but add nothing to the sums.
+
+        Returns:
+            dict:
+                - total (float), count (int): Sum and number of amounts.
+                - last (float): Amount of the last row, None when empty.
+                - day, month, type (dict): Sum of amounts per 'YYYY-MM-DD', 'YYYY-MM' and transaction type.
+        """
+        with self.lock:
+            rows = self.connection.execute(f"SELECT kind, key, amount, count FROM rollup_{ledger}").fetchall()
+            last = self.connection.execute(f"SELECT COALESCE(base, 0.0) FROM {ledger} ORDER BY position DESC LIMIT 1").fetchone()
+        result = {"total": 0.0, "count": 0, "last": last[0] if last is not None else None, "day": {}, "month": {}, "type": {}}
+        for kind, key, amount, count in rows:
+            if kind == "total":
+                result["total"], result["count"] = amount, count
+            else:
+                result[kind][key] = amount
+        return result
+
+    def _enqueue(self, method:str, ledger:str, *args) -> None:
+        self.connection.execute(
+            "INSERT INTO outbox (method, ledger, args) VALUES (?, ?, ?)", (method, ledger, json.dumps(args, default=str))
+        )
+
+    def _enqueue_partitions(self, method:str, ledger:str, partitions:dict, totalled:set=None) -> int:
+        """
+        Record one write per partition, then refresh the archive if the totals of a past year changed.
+
+        Args:
+            partitions (dict): First argument of the write for each partition.
+            totalled (set): Partitions whose totals changed, every partition written to by default.
+
+        Returns:
+            int: Number of writes recorded, the archive rewrite included.
+        """
+        for partition, args in partitions.items():
+            self._enqueue(method, partition_key(ledger, partition), args)
+        if any(is_closed(partition) for partition in (partitions if totalled is None else totalled)):
+            self._enqueue_archive()
+            return len(partitions) + 1
+        return len(partitions)
+
+    def _archive_rows(self) -> list:
+        rows = []
+        for ledger in LEDGERS:
+            for rollup, key in (("month", "substr(date, 1, 7)"), ("type", "type")):
+                rows.extend([ledger, year, rollup, group, amount, count] for year, group, amount, count in self.connection.execute(
+                    f"SELECT year, COALESCE({key}, ''), COALESCE(SUM(base), 0), COUNT(*) FROM {ledger} WHERE year < ? GROUP BY 1, 2 ORDER BY 1, 2",
+                    (current_year(),),
+                ))
+        return rows
+
+    def archive(self) -> list:
+        """
+        Totals in the base currency per month and per transaction type of every closed partition.
+
+        Returns:
+            list: [Ledger, Year, Rollup ('month' or 'type'), Key, Amount, Count] rows, see ARCHIVE_COLUMNS.
+        """
+        with self.lock:
+            return self._archive_rows()
+
+    def _enqueue_archive(self) -> None:
+        self._enqueue("archive", ARCHIVE, self._archive_rows())
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('archived', ?)", (current_year(),))
+
+    def _archive_stale(self) -> bool:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'archived'").fetchone()
+        return row is None or row[0] != current_year()
+
+    def enqueue_archive(self, stale_only:bool=False) -> bool:
+        """
+        Record a rewrite of the replica's archive with the current totals of the closed partitions.
+
+        Args:
+            stale_only (bool): Only record it if a year has closed since the archive
+                was last written, checked in the same transaction.
+
+        Returns:
+            bool: Whether the rewrite was recorded.
+        """
+        with self.lock, self.connection:
+            if stale_only and not self._archive_stale():
+                return False
+            self._enqueue_archive()
+            return True
+
+    def is_partitioned(self) -> bool:
+        """
+        Whether the copy of the ledgers into year partitions has been recorded for the replica.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT value FROM meta WHERE key = 'partitioned'").fetchone() is not None
+
+    def enqueue_partitioning(self) -> None:
+        """
+        Record the move of the replica from one worksheet per ledger to one worksheet per year.
+
+        Every partition is rewritten from the local rows, so the move can be
+        replayed after an interruption; the single worksheets are then emptied
+        and the archive written last.
+        """
+        with self.lock, self.connection:
+            for ledger in LEDGERS:
+                partitions = {}
+                for year, *row in self.connection.execute(
+                    f"SELECT year, {', '.join(_SQL_COLUMNS)} FROM {ledger} ORDER BY year, position"
+                ):
+                    partitions.setdefault(year, []).append(row)
+                for partition, rows in partitions.items():
+                    self._enqueue("clear", partition_key(ledger, partition), None)
+                    self._enqueue("append", partition_key(ledger, partition), rows)
+                self._enqueue("clear", ledger, self.count(ledger))
+            self._enqueue_archive()
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('partitioned', '1')")
+
+    def outbox(self, limit:int=-1) -> list:
+        """
+        Writes not yet applied to the replica, oldest first.
+
+        Args:
+            limit (int): Maximum number of writes returned, -1 for all of them.
+
+        Returns:
+            list: (id, method, ledger, args) tuples.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT id, method, ledger, args FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(id, method, ledger, tuple(json.loads(args))) for id, method, ledger, args in rows]
+
+    def acknowledge(self, ids:list[int]) -> None:
+        """
+        Remove writes applied to the replica from the outbox.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM outbox WHERE id = ?", [(id,) for id in ids])
+
+    def pending_writes(self) -> int:
+        """
+        Number of writes in the outbox.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letter(self, ids:list[int], error:Exception) -> None:
+        """
+        Move writes the replica rejected for good from the outbox to the dead letters.
+
+        Args:
+            ids (list): Outbox ids of the writes.
+            error (Exception): Error the replica raised.
+        """
+        message = str(error) if str(error).startswith(type(error).__name__) else f"{type(error).__name__}: {error}"
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO dead_letters (id, method, ledger, args, error, failed_at) "
+                "SELECT id, method, ledger, args, ?, ? FROM outbox WHERE id = ?",
+                [(message, datetime.now().isoformat(timespec="seconds"), id) for id in ids],
+            )
+            self.connection.executemany("DELETE FROM outbox WHERE id = ?", [(id,) for id in ids])
+
+    def enqueue_rebuild(self, key:str) -> None:
+        """
+        Record a rewrite of one worksheet of the replica with the local rows, e.g. once a write to it failed for good.
+
+        The writes to it still in the outbox are addressed by rows of a
+        worksheet that no longer matches the local rows; they are dropped,
+        the rewrite holding their changes. Replication to the worksheet resumes
+        if it was halted.
+
+        Args:
+            key (str): Replica key, e.g. 'spendings:2024' (see partition_key).
+        """
+        ledger, partition = split_key(key)
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM outbox WHERE ledger = ?", (key,))
+            self.connection.execute("DELETE FROM meta WHERE key = ?", (f"halted:{key}",))
+            rows = self.connection.execute(
+                f"SELECT {', '.join(_SQL_COLUMNS)} FROM {ledger} {'WHERE year = ?' if partition else ''} ORDER BY position",
+                (partition,) if partition else (),
+            ).fetchall()
+            self._enqueue("rebuild", key, [list(row) for row in rows])
+
+    def halt(self, key:str) -> None:
+        """
+        Stop replicating to a worksheet that could not be rebuilt, until enqueue_rebuild is called for it.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')", (f"halted:{key}",))
+
+    def halted(self) -> list:
+        """
+        Replica keys of the worksheets replication to is halted.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT key FROM meta WHERE key LIKE 'halted:%' ORDER BY key").fetchall()
+        return [key.partition(":")[2] for key, in rows]
+
+    def dead_letters(self) -> list:
+        """
+        Writes the replica rejected for good, oldest first.
+
+        Returns:
+            list: Dictionaries with the keys id, method, ledger, args, error and failed_at.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, method, ledger, args, error, failed_at FROM dead_letters ORDER BY id"
+            ).fetchall()
+        return [
+            {"id": id, "method": method, "ledger": ledger, "args": tuple(json.loads(args)), "error": error, "failed_at": failed_at}
+            for id, method, ledger, args, error, failed_at in rows
+        ]
+
+    def append(self, ledger:str, rows:list[list], replicate:bool=False, partition:str=None, expected:int=None, number:bool=False) -> list:
+        """
+        Append rows ([Number, Amount, Date, Type, Comments, Currency, Rate Date], the last two optional) to a ledger.
+
+        Each row goes to the end of the partition of its date, unless a partition is given.
+
+        Args:
+            partition (str): Partition to file every row in.
+            expected (int): Number of rows the partition must hold, checked in the same
+                transaction; the rows are dropped when it holds another number.
+            number (bool): Give the rows the next transaction numbers, in place of their
+                first cell, in the same transaction, so concurrent appends never share a number.
+
+        Returns:
+            list: The rows appended, empty when they were dropped.
+        """
+        rows = [[cell_value(value) for value in pad_row(row)] for row in rows]
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(partition or partition_of(row[2]), []).append(row)
+        with self.lock, self.connection:
+            if expected is not None and self.partition_count(ledger, partition) != expected:
+                return []
+            if number:
+                first = self.next_number(ledger)
+                for i, row in enumerate(rows):
+                    row[0] = first + i
+            count = self.count(ledger)
+            self.connection.executemany(
+                f"INSERT INTO {ledger} ({', '.join(_SQL_COLUMNS)}, year, base) VALUES ({', '.join('?' * (len(COLUMNS) + 2))})",
+                [row + [year, base_amount(row[1], row[5])] for year, year_rows in partitions.items() for row in year_rows],
+            )
+            self._set_count(ledger, count + len(rows))
+            self._set_next_number(ledger, rows)
+            self._rollup(ledger, [(base_amount(row[1], row[5]), row[2], row[3]) for row in rows], 1)
+            self._bump(ledger)
+            if replicate:
+                self._enqueue_partitions("append", ledger, partitions)
+        return rows
+
+    def update(self, ledger:str, changes:list[list[int, int, str]], replicate:bool=False, numbers:dict=None) -> int:
+        """
+        Apply cell changes addressed by worksheet row and column (both 1-based).
+
+        Args:
+            numbers (dict): Number of the transaction each row held when the changes
+                were made. The rows are then found by Number in the same transaction and
+                the changes re-addressed in place, changes to deleted transactions dropped.
+
+        Returns:
+            int: Number of writes recorded for the replica, 0 without replicate.
+
+        Raises:
+            ValueError: See _relocate; nothing is changed then.
+        """
+        with self.lock, self.connection:
+            if numbers is not None:
+                relocated = self._relocate(ledger, {change[0] for change in changes}, numbers)
+                changes[:] = [[relocated[row], column, value] for row, column, value in changes if relocated[row] is not None]
+            located = self._locate(ledger)
+            positions = [position for position, _, _ in located]
+            changes = [change for change in changes if 2 <= change[0] < len(positions) + 2 and 1 <= change[1] <= len(COLUMNS)]
+            totalled = {change[0] for change in changes if change[1] in (2, 3, 4, 6, 7)}
+            touched = [(positions[row - 2],) for row in totalled]
+            repriced = [(positions[row - 2],) for row in {change[0] for change in changes if change[1] in (2, 6, 7)}]
+            select = f"SELECT base, date, type FROM {ledger} WHERE position = ?"
+            self._rollup(ledger, [self.connection.execute(select, position).fetchone() for position in touched], -1)
+            for row, column, value in changes:
+                self.connection.execute(
+                    f"UPDATE {ledger} SET {_SQL_COLUMNS[column - 1]} = ? WHERE position = ?",
+                    (cell_value(value), positions[row - 2]),
+                )
+            self.connection.executemany(
+                f"UPDATE {ledger} SET base = CASE WHEN {_IN_BASE} THEN amount END WHERE position = ?", repriced
+            )
+            self._rollup(ledger, [self.connection.execute(select, position).fetchone() for position in touched], 1)
+            self._bump(ledger)
+            if replicate:
+                partitions = {}
+                for row, column, value in changes:
+                    _, partition, partition_row = located[row - 2]
+                    partitions.setdefault(partition, []).append([partition_row, column, cell_value(value)])
+                return self._enqueue_partitions("update", ledger, partitions, {located[row - 2][1] for row in totalled})
+        return 0
+
+    def delete(self, ledger:str, rows:list[int], replicate:bool=False, numbers:dict=None) -> int:
+        """
+        Delete rows addressed by worksheet row (1-based, row 1 being the header).
+
+        Args:
+            numbers (dict): Number of the transaction each row held, see update; the
+                rows are re-addressed in place, transactions already deleted dropped.
+
+        Returns:
+            int: Number of writes recorded for the replica, 0 without replicate.
+
+        Raises:
+            ValueError: See _relocate; nothing is deleted then.
+        """
+        with self.lock, self.connection:
+            if numbers is not None:
+                relocated = self._relocate(ledger, set(rows), numbers)
+                rows[:] = [relocated[row] for row in rows if relocated[row] is not None]
+            located = self._locate(ledger)
+            positions = [position for position, _, _ in located]
+            rows = sorted(row for row in set(rows) if 2 <= row < len(positions) + 2)
+            doomed = [(positions[row - 2],) for row in rows]
+            select = f"SELECT base, date, type FROM {ledger} WHERE position = ?"
+            self._rollup(ledger, [self.connection.execute(select, position).fetchone() for position in doomed], -1)
+            self.connection.executemany(f"DELETE FROM {ledger} WHERE position = ?", doomed)
+            self._set_count(ledger, len(positions) - len(doomed))
+            self._bump(ledger)
+            if replicate:
+                partitions = {}
+                for row in rows:
+                    _, partition, partition_row = located[row - 2]
+                    partitions.setdefault(partition, []).append(partition_row)
+                return self._enqueue_partitions("delete", ledger, partitions)
+        return 0
+
+    def unconverted(self, ledger:str) -> list:
+        """
+        Rows entered in another currency whose amount in the base currency is not known yet.
+
+        Returns:
+            list: (position, amount, currency, rate date) tuples, the rate date
+                defaulting to the transaction date.
+        """
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT position, amount, currency, COALESCE(rate_date, date) FROM {ledger} WHERE base IS NULL ORDER BY position"
+            ).fetchall()
+
+    def set_base(self, ledger:str, bases:list[tuple]) -> None:
+        """
+        Store converted amounts of rows listed by unconverted and add them to the rollups.
+
+        Rows changed or deleted since are left alone.
+
+        Args:
+            bases (list): (position, amount in the base currency) tuples.
+        """
+        with self.lock, self.connection:
+            select = f"SELECT base, date, type, year FROM {ledger} WHERE position = ? AND base IS NULL"
+            found = [(position, base, self.connection.execute(select, (position,)).fetchone()) for position, base in bases]
+            found = [(position, base, row) for position, base, row in found if row is not None]
+            if not found:
+                return
+            self._rollup(ledger, [row[:3] for _, _, row in found], -1)
+            self.connection.executemany(f"UPDATE {ledger} SET base = ? WHERE position = ?", [(base, position) for position, base, _ in found])
+            self._rollup(ledger, [(base,) + tuple(row[1:3]) for _, base, row in found], 1)
+            self._bump(ledger)
+            if any(is_closed(row[3]) for _, _, row in found):
+                self._enqueue_archive()
+
+    def clear(self, ledger:str, count:int=None, replicate:bool=False) -> None:
+        """
+        Remove every row of a ledger.
+        """
+        with self.lock, self.connection:
+            partitions = dict(self.connection.execute(f"SELECT year, COUNT(*) FROM {ledger} GROUP BY year").fetchall())
+            self.connection.execute(f"DELETE FROM {ledger}")
+            self._set_count(ledger, 0)
+            self._set_next_number(ledger)
+            self._rebuild_rollups(ledger)
+            self._bump(ledger)
+            if replicate:
+                self._enqueue_partitions("clear", ledger, partitions)
+
+    def replace(self, ledger:str, records:list[dict]) -> None:
+        """
+        Replace a ledger with records fetched from Google Sheets and mark it hydrated.
+
+        Records read from a partition carry it under "Partition", the others are filed by date.
+        """
+        rows = [[cell_value(record.get(column)) for column in COLUMNS] for record in records]
+        years = [record.get("Partition") or partition_of(row[2]) for record, row in zip(records, rows)]
+        with self.lock, self.connection:
+            self.connection.execute(f"DELETE FROM {ledger}")
+            self.connection.executemany(
+                f"INSERT INTO {ledger} ({', '.join(_SQL_COLUMNS)}, year, base) VALUES ({', '.join('?' * (len(COLUMNS) + 2))})",
+                [row + [str(year), base_amount(row[1], row[5])] for row, year in zip(rows, years)],
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"hydrated:{ledger}", "1")
+            )
+            self._set_count(ledger, len(rows))
+            self._set_next_number(ledger)
+            self._set_next_number(ledger, rows)
+            self._rebuild_rollups(ledger)
+            self._bump(ledger)
+
+
+def coalesce(operations:list[tuple], max_rows:int=MAX_APPEND_ROWS) -> list[tuple]:
+    """
+    Merge consecutive appends, and consecutive cell updates, to the same ledger.
+
+    Operations on different ledgers are independent, so an operation only has
+    to follow the previous operation on its own ledger to be merged into it.
+    Merged updates keep one change per cell, the latest value winning, and of
+    consecutive archive rewrites only the latest is kept.
+
+    Args:
+        operations (list): (method, ledger, args) tuples in submission order.
+        max_rows (int): Appends are not merged past this many rows, keeping
+            each append_rows request well under the API's payload limit.
+
+    Returns:
+        list: (method, ledger, args, sources) tuples still in order per ledger,
+            sources being the positions of the merged operations in the input.
+    """
+    merged = []
+    last = {}
+    for i, (method, ledger, args) in enumerate(operations):
+        previous = last.get(ledger)
+        if method == "archive" and previous is not None and merged[previous][0] == method:
+            merged[previous] = (method, ledger, args, merged[previous][3] + [i])
+        elif (method in ("append", "update") and previous is not None and merged[previous][0] == method
+                and (method == "update" or len(merged[previous][2][0]) + len(args[0]) <= max_rows)):
+            merged[previous][2][0].extend(args[0])
+            merged[previous][3].append(i)
+        else:
+            if method in ("append", "update"):
+                args = (list(args[0]),) + tuple(args[1:])
+            last[ledger] = len(merged)
+            merged.append((method, ledger, args, [i]))
+    for method, ledger, args, sources in merged:
+        if method == "update":
+            cells = {(row, column): value for row, column, value in args[0]}
+            args[0][:] = [[row, column, value] for (row, column), value in cells.items()]
+    return merged
+
+
+def is_transient(error:Exception) -> bool:
+    """
+    Whether a failed replica write may succeed when retried.
+
+    Network errors, rate limiting and server errors are transient; anything
+    else (a rejected request, a missing worksheet, a bug) fails the same way
+    every time.
+    """
+    return isinstance(error, OSError) or getattr(error, "code", None) in rate_limit.RETRY_CODES
+
+
+class Replicator(threading.Thread):
+    """
+    A background thread replaying local writes onto a replica backend (Google Sheets).
+
+    Writes are read from the outbox of a journal (SQLiteBackend), so they
+    survive a restart and are applied in the order they were recorded. Writes
+    recorded within flush_interval of each other are flushed together,
+    consecutive appends becoming one append_rows call and consecutive cell
+    updates one batch_update. An operation failing with a transient error
+    (see is_transient) stays at the head of the outbox and is retried, so the
+    replica never sees writes out of order. Any other failure moves the
+    operation to the journal's dead letters; as later writes to its worksheet
+    are addressed by rows the worksheet may no longer have, they are replaced
+    by a rebuild of the worksheet from the journal's rows (the archive, being
+    rewritten whole every time, is left for its next write). A rebuild that
+    fails for good halts replication to the worksheet, its writes going
+    straight to the dead letters, until it is rebuilt on request.
+
+    Every write is applied while holding self.lock, so a reader can compare
+    the replica with the journal without a write landing in between.
+    """
+    background = True  # Lets the Sheets quota scheduler serve interactive calls first.
+
+    def __init__(self, backend, journal, retry_delay:float=5.0, flush_interval:float=1.0, batch_size:int=100):
+        """
+        Args:
+            backend: Object exposing append, update, delete, clear, rebuild and archive like SheetsBackend.
+            journal (SQLiteBackend): Store whose outbox holds the writes to replay.
+            retry_delay (float): Seconds to wait before retrying an operation that failed with a transient error.
+            flush_interval (float): Seconds to buffer writes before flushing them.
+            batch_size (int): Maximum number of outbox writes read and coalesced at once.
+        """
+        super().__init__(daemon=True)
+        self.backend = backend
+        self.journal = journal
+        self.retry_delay = retry_delay
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.wakeup = threading.Event()
+        self.idle = threading.Condition()
+        self.lock = threading.Lock()
+        self.last_error = None
+        if journal.pending_writes():
+            self.wakeup.set()  # Drain the writes left over by a previous run.
+        self.start()
+
+    def notify(self) -> None:
+        """
+        Wake the thread up after writes were recorded in the journal's outbox.
+        """
+        self.wakeup.set()
+
+    def pending(self) -> int:
+        """
+        Number of writes not yet applied to the replica.
+        """
+        return self.journal.pending_writes()
+
+    def wait(self) -> None:
+        """
+        Block until every queued write has been applied.
+        """
+        self.notify()
+        with self.idle:
+            self.idle.wait_for(lambda: not self.pending())
+
+    def _apply(self, method:str, ledger:str, args:tuple, ids:list[int]) -> bool:
+        """
+        Apply one write, retrying transient errors, and dead-letter it on any other error.
+
+        Returns:
+            bool: False when the write failed for good.
+        """
+        while True:
+            try:
+                with self.lock:
+                    getattr(self.backend, method)(ledger, *args)
+                self.last_error = None
+                self.journal.acknowledge(ids)
+                return True
+            except Exception as e:
+                if is_transient(e):
+                    self.last_error = e
+                    time.sleep(self.retry_delay)
+                    continue
+                self.last_error = None
+                self.journal.dead_letter(ids, e)
+                if method == "rebuild":
+                    self.journal.halt(ledger)
+                elif ledger != ARCHIVE:
+                    self.journal.enqueue_rebuild(ledger)
+                return False
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            time.sleep(self.flush_interval)
+            journaled = self.journal.outbox(self.batch_size)
+            if len(journaled) == self.batch_size:
+                self.wakeup.set()  # More writes are waiting behind this batch.
+            halted = set(self.journal.halted())
+            for method, ledger, args, sources in coalesce([operation[1:] for operation in journaled]):
+                ids = [journaled[i][0] for i in sources]
+                if ledger in halted:
+                    self.journal.dead_letter(ids, RuntimeError(f"Replication to {ledger} is halted."))
+                    continue
+                if not self._apply(method, ledger, args, ids):
+                    # The outbox changed under the rest of the batch, read it again.
+                    self.wakeup.set()
+                    break
+            with self.idle:
+                self.idle.notify_all()
@@ -1,26 +1,367 @@
 import json
+import os
+import queue
+import re
+import threading
+import time
 from datetime import datetime
+from framework import telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only.
+    fcntl = None
+
+
+class _LogWriter(threading.Thread):
+    """
+    Background thread appending buffered log lines to a JSON-lines file.
+
+    One writer is shared by every MasterLogger of the process writing to the
+    same file. Each flush takes an exclusive file lock so several processes can
+    append to the same log without clobbering each other.
+
+    A batch that cannot be written (missing directory, full disk, failed
+    rotation) is dropped and its error kept in last_error, so the thread
+    keeps serving later lines.
+    """
+
+    def __init__(self, path:str, flush_interval:float, max_bytes:int, rotate_interval:float, backup_count:int):
+        super().__init__(daemon=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.lines = queue.Queue()
+        self.lock = threading.Lock()
+        self.opened_at = time.time()
+        self.last_error = None
+        self.start()
+
+    def rotated_paths(self) -> list:
+        """
+        Rotated files from the oldest to the newest.
+        """
+        return [f"{self.path}.{i}" for i in range(self.backup_count, 0, -1) if os.path.exists(f"{self.path}.{i}")]
+
+    def _should_rotate(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if self.max_bytes and stat.st_size >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and stat.st_size > 0 and time.time() - self.opened_at >= self.rotate_interval
+
+    def _rotate(self) -> None:
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.opened_at = time.time()
+
+    @telemetry.timed("log.write")
+    def write(self, lines:list[str]) -> None:
+        with self.lock:
+            with open(self.path, "a") as file:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    file.write("".join(lines))
+                    file.flush()
+                    if self.backup_count and self._should_rotate():
+                        self._rotate()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(file, fcntl.LOCK_UN)
+
+    def flush(self) -> None:
+        """
+        Block until every buffered line has been written, or dropped, or the thread is gone.
+        """
+        with self.lines.all_tasks_done:
+            while self.lines.unfinished_tasks and self.is_alive():
+                self.lines.all_tasks_done.wait(self.flush_interval + 1)
+
+    def run(self) -> None:
+        while True:
+            batch = [self.lines.get()]
+            time.sleep(self.flush_interval)
+            while True:
+                try:
+                    batch.append(self.lines.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                telemetry.count("log.dropped_lines", len(batch))
+            finally:
+                for _ in batch:
+                    self.lines.task_done()
+
+
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+_TAG = re.compile(r"^\[[^\]]+\]")
+
+
+def _entry_tag(entry:list) -> str:
+    match = _TAG.match(entry[0])
+    return match.group(0) if match else None
+
+
+def _entry_time(entry:list) -> datetime:
+    return datetime.strptime(entry[1], DATE_FORMAT)
+
+
+class _Block:
+    """
+    Summary of a run of consecutive log entries: where they start and what they contain.
+    """
+    __slots__ = ("offset", "count", "first", "last", "tags", "entries")
+
+    def __init__(self, offset:int, entries:list=None):
+        self.offset = offset
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.tags = {}
+        self.entries = entries
+
+    def add(self, entry:list) -> None:
+        when = _entry_time(entry)
+        tag = _entry_tag(entry)
+        self.first = when if self.first is None else min(self.first, when)
+        self.last = when if self.last is None else max(self.last, when)
+        self.tags[tag] = self.tags.get(tag, 0) + 1
+        self.count += 1
+
+
+class _FileIndex:
+    """
+    Sparse offset index of a JSON-lines log: one _Block per block_size lines.
+
+    The log is append-only, so a refresh only parses the bytes written since
+    the previous one; the index is rebuilt when the file was truncated or
+    replaced by a rotation.
+    """
+
+    def __init__(self, path:str, block_size:int):
+        self.path = path
+        self.block_size = block_size
+        self.blocks = []
+        self.size = 0
+        self.inode = None
+
+    @telemetry.timed("log.index_refresh")
+    def refresh(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.blocks, self.size, self.inode = [], 0, None
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.size:
+            self.blocks, self.size, self.inode = [], 0, stat.st_ino
+        if stat.st_size == self.size:
+            return
+        with open(self.path, "rb") as file:
+            file.seek(self.size)
+            offset = self.size
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break  # Still being written, picked up by the next refresh.
+                try:
+                    entry = json.loads(line)
+                    if not self.blocks or self.blocks[-1].count >= self.block_size:
+                        self.blocks.append(_Block(offset))
+                    self.blocks[-1].add(entry)
+                except ValueError:
+                    pass
+                offset += len(line)
+            self.size = offset
+
+    def read(self, block:_Block) -> list:
+        """
+        Read the entries of one block by seeking to its offset.
+        """
+        entries = []
+        with open(self.path, "rb") as file:
+            file.seek(block.offset)
+            for line in file:
+                if len(entries) >= block.count:
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+_indexes = {}
+_indexes_lock = threading.Lock()
+
 
 class MasterLogger:
-    def __init__(self, log_file_path="logs/log.json"):
+    def __init__(self, log_file_path="logs/log.jsonl", legacy_log_path="logs/log.json", flush_interval:float=0.5,
+                 max_bytes:int=1_000_000, rotate_interval:float=None, backup_count:int=5, block_size:int=256):
+        """
+        Append-only JSON-lines event log with a buffered background writer.
+
+        Args:
+            log_file_path (str): JSON-lines file new entries are appended to.
+            legacy_log_path (str): Old single-document log ({"logs": [...]}) still read by fetch_logs.
+            flush_interval (float): Seconds entries are buffered before being written.
+            max_bytes (int): Rotate the log once it reaches this size, None to disable.
+            rotate_interval (float): Rotate the log once it is this many seconds old, None to disable.
+            backup_count (int): Number of rotated files kept.
+            block_size (int): Entries per block of the sparse index used by query_logs.
+        """
         self.log_file_path = log_file_path
+        self.legacy_log_path = legacy_log_path
+        self.block_size = block_size
+        with _writers_lock:
+            if log_file_path not in _writers or not _writers[log_file_path].is_alive():
+                _writers[log_file_path] = _LogWriter(log_file_path, flush_interval, max_bytes, rotate_interval, backup_count)
+            self.writer = _writers[log_file_path]
+
+    def _read_lines(self, path:str) -> list:
+        entries = []
+        with open(path, "r") as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # A line cut short by a crash.
+        return entries
 
     def fetch_logs(self) -> dict:
-        with open(self.log_file_path, "r") as file:
-            return json.load(file)
+        self.flush()
+        logs = []
+        if self.legacy_log_path is not None and os.path.exists(self.legacy_log_path):
+            with open(self.legacy_log_path, "r") as file:
+                logs.extend(json.load(file)["logs"])
+        for path in self.writer.rotated_paths() + [self.log_file_path]:
+            if os.path.exists(path):
+                logs.extend(self._read_lines(path))
+        return {"logs": logs}
+
+    def _blocks(self) -> list:
+        """
+        Every block of the log in chronological order, as (reader, block) pairs.
+        """
+        blocks = []
+        if self.legacy_log_path is not None and os.path.exists(self.legacy_log_path):
+            with _indexes_lock:
+                key = (self.legacy_log_path, os.stat(self.legacy_log_path).st_mtime_ns)
+                if key not in _indexes:
+                    with open(self.legacy_log_path, "r") as file:
+                        entries = json.load(file)["logs"]
+                    legacy_blocks = []
+                    for i in range(0, len(entries), self.block_size):
+                        block = _Block(i, entries[i:i + self.block_size])
+                        for entry in block.entries:
+                            block.add(entry)
+                        legacy_blocks.append(block)
+                    _indexes[key] = legacy_blocks
+            blocks.extend((None, block) for block in _indexes[key])
+        for path in self.writer.rotated_paths() + [self.log_file_path]:
+            with _indexes_lock:
+                index = _indexes.setdefault(path, _FileIndex(path, self.block_size))
+                index.refresh()
+                blocks.extend((index, block) for block in index.blocks)
+        return blocks
+
+    def log_tags(self) -> list:
+        """
+        Every event tag ("[LOG IN]", "[UPDATED]", ...) found in the log.
+        """
+        self.flush()
+        return sorted({tag for _, block in self._blocks() for tag in block.tags if tag is not None})
+
+    @telemetry.timed("log.query")
+    def query_logs(self, offset:int=0, limit:int=50, start:datetime=None, end:datetime=None, tags:list=None, newest_first:bool=True) -> dict:
+        """
+        Return one page of log entries matching a time range and a set of event tags.
+
+        Only the blocks holding the page, or straddling the time range, are read;
+        the others are counted from the index.
+
+        Args:
+            offset (int): Number of matching entries to skip.
+            limit (int): Maximum number of entries returned.
+            start (datetime): Earliest entry time, None for no lower bound.
+            end (datetime): Latest entry time, None for no upper bound.
+            tags (list): Event tags to keep, e.g. ["[LOG IN]"], None for every entry.
+            newest_first (bool): Page from the newest entry backwards.
+
+        Returns:
+            dict: {"logs": [...], "total": number of matching entries}.
+        """
+        self.flush()
+        tags = set(tags) if tags else None
+
+        def matches(entry:list) -> bool:
+            if tags is not None and _entry_tag(entry) not in tags:
+                return False
+            when = _entry_time(entry)
+            return (start is None or when >= start) and (end is None or when <= end)
+
+        blocks = self._blocks()
+        if newest_first:
+            blocks.reverse()
+        page, total = [], 0
+        for reader, block in blocks:
+            if (start is not None and block.last < start) or (end is not None and block.first > end):
+                continue
+            if tags is not None and not tags & block.tags.keys():
+                continue
+            inside = (start is None or block.first >= start) and (end is None or block.last <= end)
+            entries = None
+            if inside:
+                count = block.count if tags is None else sum(block.tags.get(tag, 0) for tag in tags)
+            else:
+                entries = [entry for entry in (block.entries or reader.read(block)) if matches(entry)]
+                count = len(entries)
+            if len(page) < limit and total + count > offset:
+                if entries is None:
+                    entries = [entry for entry in (block.entries or reader.read(block)) if matches(entry)]
+                if newest_first:
+                    entries = entries[::-1]
+                page.extend(entries[max(offset - total, 0):][:limit - len(page)])
+            total += count
+        return {"logs": page, "total": total}
 
     def log_info(self, text: str) -> None:
-        logs_data = self.fetch_logs()
-        logs = logs_data["logs"]
-        dt_string = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        dt_string = datetime.now().strftime(DATE_FORMAT)
         log_entry = (text, dt_string)
-        logs.append(log_entry)
-        logs_data["logs"] = logs
-        with open(self.log_file_path, "w") as file:
-            json.dump(logs_data, file, indent=4)
+        self.writer.lines.put(json.dumps(log_entry) + "\n")
+
+    def flush(self) -> None:
+        """
+        Block until every buffered entry has been written.
+        """
+        self.writer.flush()
+
+    def write_error(self) -> Exception:
+        """
+        Error of the last failed write to the log file, None once a write succeeds.
+        """
+        return self.writer.last_error
+
     def clear_log(self) -> bool:
-        logs = []
-        with open(self.log_file_path, "w") as file:
-            json.dump({"logs":logs}, file, indent=4)
+        self.flush()
+        with self.writer.lock:
+            for path in self.writer.rotated_paths():
+                os.remove(path)
+            open(self.log_file_path, "w").close()
+            if self.legacy_log_path is not None and os.path.exists(self.legacy_log_path):
+                with open(self.legacy_log_path, "w") as file:
+                    json.dump({"logs": []}, file, indent=4)
         return True
-
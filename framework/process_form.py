@@ -1,17 +1,15 @@
 #Form processing machanism
-from framework import forex_conversion, sheet
-
-def currency_conversion(value:float, original_currency:str, final_currency:str='USD') -> float:
-    if original_currency == final_currency:
-        return value
-    else:
-        return forex_conversion.convert_currency(value, original_currency, final_currency)
+from framework import sheet
 
 #data meaning [int:(0 for income, 1 for spendings)]
 def process_form(data: list[str, float, str, str, str, str], logger:sheet.SheetLogger) -> bool:
     """
     Process a form submission.
 
+    The amount is logged in its own currency, to be converted at the rate of
+    the transaction date when the ledger is read (SheetLogger.convert_amounts),
+    so submitting never waits on the exchange rates API.
+
     Args:
         data (list):
             - type (str): Either 'spendings' or 'income'.
@@ -24,10 +22,10 @@ def process_form(data: list[str, float, str, str, str, str], logger:sheet.SheetL
     Returns:
         bool: True if the form is processed successfully, False otherwise.
     """
-    amount = currency_conversion(data[1], data[2])
+    amount, currency = data[1], data[2]
     date, transaction_type, comments = data[3], data[4], data[5]
     if data[0] == 'spendings':
-        logger.log_spending([amount, date, transaction_type, comments], True)
+        logger.log_spending([amount, date, transaction_type, comments, currency, date], True)
     elif data[0] == 'income':
-        logger.log_income([amount, date, transaction_type, comments], True)
+        logger.log_income([amount, date, transaction_type, comments, currency, date], True)
     return True
\ No newline at end of file
@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+import gspread
+
+READ = "read"
+WRITE = "write"
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# gspread methods that count against the write quota, every other call is a read.
+WRITE_METHODS = {
+    "append_row", "append_rows", "batch_update", "batch_clear", "clear", "delete_rows",
+    "insert_row", "insert_rows", "update", "update_cell", "update_cells", "values_batch_update",
+    "add_worksheet", "del_worksheet",
+}
+# HTTP statuses worth retrying: rate limiting and server errors. The Replicator retries them too.
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at rate tokens per second, holding at most capacity tokens.
+
+    Interactive callers are served before background ones: a background caller
+    only takes a token when no interactive caller is waiting.
+    """
+
+    def __init__(self, capacity:float, rate:float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.waiting = [0, 0]
+        self.condition = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _blocked(self, priority:int) -> bool:
+        return self.tokens < 1 or any(self.waiting[:priority])
+
+    def acquire(self, priority:int=INTERACTIVE) -> float:
+        """
+        Take one token, waiting for it if the bucket is empty.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        started = time.monotonic()
+        with self.condition:
+            self._refill()
+            if not self._blocked(priority):
+                self.tokens -= 1
+                return 0.0
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    if not self._blocked(priority):
+                        self.tokens -= 1
+                        break
+                    self.condition.wait(max((1 - self.tokens) / self.rate, 0.01))
+            finally:
+                self.waiting[priority] -= 1
+                self.condition.notify_all()
+        return time.monotonic() - started
+
+
+class QuotaScheduler:
+    """
+    Process-wide gate in front of every Google Sheets API call.
+
+    Calls are spaced by one token bucket per quota (reads and writes, per
+    minute), so the app stays under the quota instead of reacting to errors.
+    Calls that still fail with a quota or server error are retried with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, reads_per_minute:int=60, writes_per_minute:int=60, retries:int=5, backoff:float=1.0, max_backoff:float=32.0):
+        """
+        Args:
+            reads_per_minute (int): Read requests allowed per minute.
+            writes_per_minute (int): Write requests allowed per minute.
+            retries (int): Attempts before an error is raised.
+            backoff (float): Base of the exponential backoff in seconds.
+            max_backoff (float): Upper bound of one backoff in seconds.
+        """
+        self.buckets = {
+            READ: TokenBucket(reads_per_minute, reads_per_minute / 60),
+            WRITE: TokenBucket(writes_per_minute, writes_per_minute / 60),
+        }
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "throttled": 0, "throttled_seconds": 0.0, "retried": 0, "failed": 0}
+
+    def _count(self, name:str, value=1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def stats(self) -> dict:
+        """
+        Counters of the calls made so far: calls, throttled, throttled_seconds, retried and failed.
+        """
+        with self.lock:
+            return dict(self.counters)
+
+    def call(self, func, *args, kind:str=None, priority:int=None, **kwargs):
+        """
+        Call a Google Sheets API function once a token of its quota is available.
+
+        Args:
+            func (callable): The API function to call.
+            kind (str): READ or WRITE, guessed from the function name by default.
+            priority (int): INTERACTIVE or BACKGROUND, BACKGROUND by default on
+                threads flagged with a true "background" attribute.
+
+        Returns:
+            Any: The result of the API call.
+
+        Raises:
+            gspread.exceptions.APIError: If the call still fails after the retries.
+        """
+        if kind is None:
+            kind = WRITE if getattr(func, "__name__", "") in WRITE_METHODS else READ
+        if priority is None:
+            priority = BACKGROUND if getattr(threading.current_thread(), "background", False) else INTERACTIVE
+        bucket = self.buckets[kind]
+        for attempt in range(self.retries):
+            waited = bucket.acquire(priority)
+            if waited:
+                self._count("throttled")
+                self._count("throttled_seconds", waited)
+            self._count("calls")
+            try:
+                return func(*args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                if getattr(e, "code", None) not in RETRY_CODES or attempt == self.retries - 1:
+                    self._count("failed")
+                    raise
+            self._count("retried")
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> QuotaScheduler:
+    """
+    Return the scheduler shared by every session of the process.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = QuotaScheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler:QuotaScheduler) -> None:
+    """
+    Replace the process-wide scheduler, e.g. with other quotas.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+from framework import telemetry
+
+TRANSACTION_TYPES_PATH = "settings/transaction_types.json"
+CURRENCIES_PATH = "settings/currencies.json"
+
+_cache = {}
+_cache_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+
+def _stamp(path:str) -> tuple:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def load(path:str) -> dict:
+    """
+    Return a JSON settings file, parsed once per process and reparsed only when it changed on disk.
+
+    Checking for a change costs one stat call. The returned object is shared by
+    every session, so it must not be modified: go through update or save instead.
+
+    Args:
+        path (str): Path of the JSON file.
+
+    Returns:
+        dict: The parsed file.
+    """
+    stamp = _stamp(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        telemetry.cache("settings", hits=1)
+        return cached[1]
+    telemetry.cache("settings", misses=1)
+    with open(path, "r") as file:
+        data = json.load(file)
+    with _cache_lock:
+        _cache[path] = (stamp, data)
+    return data
+
+
+def save(path:str, data:dict) -> None:
+    """
+    Write a JSON settings file atomically and share it with every session.
+
+    The file is written to a temporary file next to it and renamed over it,
+    so a concurrent reader sees either the old or the new file, never half of one.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    with _cache_lock:
+        _cache[path] = (_stamp(path), data)
+
+
+def update(path:str, key:str, value) -> dict:
+    """
+    Set one key of a JSON settings file, keeping the other keys as they are on disk.
+
+    Returns:
+        dict: The new content of the file.
+    """
+    with _write_lock:
+        data = dict(load(path))
+        data[key] = value
+        save(path, data)
+    return data
+
+
+def transaction_types() -> dict:
+    """
+    Transaction types: {"spending_types": [...], "income_types": [...]}.
+    """
+    return load(TRANSACTION_TYPES_PATH)
+
+
+def currencies() -> list:
+    """
+    Currency codes offered by the forms and fetched by the rate tables.
+    """
+    return load(CURRENCIES_PATH)["currencies"]
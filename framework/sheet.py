@@ -1,10 +1,369 @@
+import bisect
 import gspread
 from google.oauth2.service_account import Credentials
+import numpy as np
+import pandas as pd
+import requests.adapters
 import streamlit as st
-import time
-from datetime import datetime
+import threading
+from framework import compact_ledger, date_index, forex_conversion, ledger_store, rate_limit, telemetry
 
-db_info = dict(st.secrets.db_info)
+TITLES = {"spendings": "Spendings", "income": "Income"}
+ARCHIVE_TITLE = "Archive"
+
+
+def coalesce_ranges(changes:list[list[int, int, str]]) -> list[dict]:
+    """
+    Coalesce cell changes into rectangular A1 ranges for a single batch_update.
+
+    Changed cells are first joined into vertical runs per column, then runs
+    covering the same rows in adjacent columns are joined into rectangles.
+    When a cell is changed twice the last value wins.
+
+    Args:
+        changes (list):
+            objects (list):
+                - row (int): Row of the data
+                - column (int): Column of the data
+                - value (str): Value
+
+    Returns:
+        list: [{"range": "B2:C9", "values": [[...], ...]}, ...] as expected by batch_update.
+    """
+    cells = {(row, column): ledger_store.cell_value(value) for row, column, value in changes}
+    columns = {}
+    for row, column in sorted(cells, key=lambda cell: (cell[1], cell[0])):
+        runs = columns.setdefault(column, [])
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    spans = {}
+    for column, runs in columns.items():
+        for start, end in runs:
+            spans.setdefault((start, end), []).append(column)
+    ranges = []
+    for (start, end), span_columns in sorted(spans.items()):
+        groups = []
+        for column in sorted(span_columns):
+            if groups and groups[-1][-1] == column - 1:
+                groups[-1].append(column)
+            else:
+                groups.append([column])
+        for group in groups:
+            ranges.append({
+                "range": f"{gspread.utils.rowcol_to_a1(start, group[0])}:{gspread.utils.rowcol_to_a1(end, group[-1])}",
+                "values": [[cells[(row, column)] for column in group] for row in range(start, end + 1)],
+            })
+    return ranges
+
+
+def row_blocks(rows:list[int]) -> list[list[int, int]]:
+    """
+    Group row numbers into contiguous [start, end] blocks in ascending order.
+    """
+    blocks = []
+    for row in sorted(set(rows)):
+        if blocks and blocks[-1][1] == row - 1:
+            blocks[-1][1] = row
+        else:
+            blocks.append([row, row])
+    return blocks
+
+
+class SheetsBackend:
+    """
+    Storage backend writing straight to the worksheets of the ledgers.
+
+    Each ledger is split into one worksheet per year ('Spendings 2024',
+    'Income 2024', ...), addressed by replica keys such as 'spendings:2024'.
+    An 'Archive' worksheet holds the totals per month and per transaction type
+    of the closed years, so the past can be summarised without reading it.
+
+    Spreadsheets from before partitioning keep the spendings and income in
+    their first two worksheets and have no archive. They are addressed by the
+    bare ledger name until SQLiteBackend.enqueue_partitioning has moved them;
+    writing the archive, the last step of the move, switches the layout.
+    """
+
+    def __init__(self, worksheets:list, api_call=None, spreadsheet=None):
+        """
+        Args:
+            worksheets (list): Every worksheet of the spreadsheet, in order.
+            api_call (callable): Wrapper used for every API call, e.g. SheetLogger.safe_api_call.
+            spreadsheet (gspread.Spreadsheet): Spreadsheet holding the worksheets, used to read
+                several ledgers with one batch_get and to add worksheets. Defaults to the worksheets' own.
+        """
+        self.api_call = api_call if api_call is not None else (lambda func, *args, **kwargs: func(*args, **kwargs))
+        self.spreadsheet = spreadsheet if spreadsheet is not None else worksheets[0].spreadsheet
+        self.last_column = gspread.utils.rowcol_to_a1(1, len(ledger_store.COLUMNS)).rstrip("0123456789")
+        self.worksheets = {}
+        ledgers = {title: ledger for ledger, title in TITLES.items()}
+        for worksheet in worksheets:
+            title, _, year = worksheet.title.rpartition(" ")
+            if worksheet.title == ARCHIVE_TITLE:
+                self.worksheets[ledger_store.ARCHIVE] = worksheet
+            elif title in ledgers and len(year) == 4 and year.isdigit():
+                self.worksheets[ledger_store.partition_key(ledgers[title], year)] = worksheet
+        self.legacy = ledger_store.ARCHIVE not in self.worksheets
+        if self.legacy:
+            self.worksheets.update(zip(ledger_store.LEDGERS, worksheets))
+
+    def worksheet(self, key:str):
+        """
+        Worksheet of a replica key, added to the spreadsheet with its header row on first use.
+        """
+        if key not in self.worksheets:
+            ledger, partition = ledger_store.split_key(key)
+            if key == ledger_store.ARCHIVE:
+                title, header = ARCHIVE_TITLE, ledger_store.ARCHIVE_COLUMNS
+            else:
+                title, header = f"{TITLES[ledger]} {partition}", ledger_store.COLUMNS
+            worksheet = self.api_call(self.spreadsheet.add_worksheet, title, 1, len(header))
+            self.api_call(worksheet.append_row, header)
+            self.worksheets[key] = worksheet
+        return self.worksheets[key]
+
+    def partitions(self, ledger:str) -> list:
+        """
+        Years of the partition worksheets of a ledger, oldest first.
+        """
+        return sorted(partition for ledger_name, partition in map(ledger_store.split_key, self.worksheets)
+                      if ledger_name == ledger and partition is not None)
+
+    @staticmethod
+    def _decode(values:list, header:list=None) -> list:
+        """
+        Turn raw cell values into records, numericised like get_all_records.
+        """
+        header = header if header is not None else ledger_store.COLUMNS
+        records = []
+        for row in values:
+            if not any(value != "" for value in row):
+                continue
+            row = gspread.utils.numericise_all(list(row) + [""] * (len(header) - len(row)))
+            records.append(dict(zip(header, row)))
+        return records
+
+    def _batch_get(self, ranges:dict) -> dict:
+        """
+        Read one A1 range per ledger with a single values_batch_get call.
+
+        Returns:
+            dict: Raw values of each ledger.
+        """
+        ledgers = list(ranges)
+        response = self.api_call(self.spreadsheet.values_batch_get, [
+            gspread.utils.absolute_range_name(self.worksheets[ledger].title, ranges[ledger]) for ledger in ledgers
+        ])
+        return {ledger: value_range.get("values", []) for ledger, value_range in zip(ledgers, response["valueRanges"])}
+
+    def fetch(self, ledger:str) -> list:
+        return self.api_call(self.worksheet(ledger).get_all_records)
+
+    def fetch_many(self, ledgers:list) -> dict:
+        """
+        Fetch every record of several ledgers with one API call covering all their partitions.
+
+        Returns:
+            dict: List of records of each ledger in sheet order, keyed by the header row like
+                get_all_records, plus the year of their worksheet under "Partition".
+        """
+        if self.legacy:
+            keys = {ledger: [ledger] for ledger in ledgers}
+        else:
+            keys = {ledger: [ledger_store.partition_key(ledger, partition) for partition in self.partitions(ledger)] for ledger in ledgers}
+        values = self._batch_get({key: f"A1:{self.last_column}" for ledger in ledgers for key in keys[ledger]}) if any(keys.values()) else {}
+        records = {}
+        for ledger in ledgers:
+            records[ledger] = []
+            for key in keys[ledger]:
+                rows = values[key]
+                partition = ledger_store.split_key(key)[1]
+                header = rows[0] if rows else []
+                if header == ledger_store.COLUMNS[:len(header)]:
+                    # Worksheets created before the last columns were added.
+                    header = ledger_store.COLUMNS
+                for record in self._decode(rows[1:], header) if rows else []:
+                    if partition is not None:
+                        record["Partition"] = partition
+                    records[ledger].append(record)
+        return records
+
+    def fetch_tails(self, known_rows:dict) -> dict:
+        """
+        Fetch the records below the known rows of several ledgers with one API call.
+
+        Args:
+            known_rows (dict): Number of records already known for each replica key.
+
+        Returns:
+            dict: List of new records of each replica key.
+        """
+        if not known_rows:
+            return {}
+        values = self._batch_get({ledger: f"A{rows + 2}:{self.last_column}" for ledger, rows in known_rows.items()})
+        return {ledger: self._decode(rows) for ledger, rows in values.items()}
+
+    def append(self, ledger:str, rows:list[list]) -> None:
+        rows = [[ledger_store.cell_value(value) for value in row] for row in rows]
+        self.api_call(self.worksheet(ledger).append_rows, rows)
+
+    def update(self, ledger:str, changes:list[list[int, int, str]]) -> int:
+        """
+        Write cell changes with one batch_update call.
+
+        Returns:
+            int: Number of API calls made.
+        """
+        if not changes:
+            return 0
+        self.api_call(self.worksheet(ledger).batch_update, coalesce_ranges(changes))
+        return 1
+
+    def delete(self, ledger:str, rows:list[int]) -> int:
+        """
+        Delete rows, one delete_rows call per contiguous block, bottom block first.
+
+        Returns:
+            int: Number of API calls made.
+        """
+        blocks = row_blocks(rows)
+        for start, end in reversed(blocks):
+            self.api_call(self.worksheet(ledger).delete_rows, start, end)
+        return len(blocks)
+
+    def clear(self, ledger:str, count:int=None) -> None:
+        if count is None:
+            count = len(self.fetch(ledger))
+        if count > 0:
+            self.api_call(self.worksheet(ledger).delete_rows, 2, count + 1)
+
+    def rebuild(self, key:str, rows:list[list]) -> None:
+        """
+        Replace every record of a worksheet with rows, see SQLiteBackend.enqueue_rebuild.
+        """
+        self.api_call(self.worksheet(key).batch_clear, [f"A2:{self.last_column}"])
+        if rows:
+            self.append(key, rows)
+
+    def archive(self, key:str, rows:list[list]) -> None:
+        """
+        Rewrite the archive worksheet with the totals of the closed partitions (see SQLiteBackend.archive).
+        """
+        worksheet = self.worksheet(key)
+        last_column = gspread.utils.rowcol_to_a1(1, len(ledger_store.ARCHIVE_COLUMNS)).rstrip("0123456789")
+        self.api_call(worksheet.batch_clear, [f"A2:{last_column}"])
+        if rows:
+            self.api_call(worksheet.append_rows, [[ledger_store.cell_value(value) for value in row] for row in rows])
+        self.legacy = False
+
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+POOL_SIZE = 32
+
+
+def safe_api_call(func, *args, **kwargs):
+    """
+    Call a Google Sheets API function through the process-wide quota scheduler.
+
+    The call waits for a token of its read or write quota, and is retried with
+    jittered backoff on quota and server errors (see rate_limit.QuotaScheduler).
+
+    Args:
+        func (callable): The API function to call.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        Any: The result of the API call.
+
+    Raises:
+        gspread.exceptions.APIError: If the API call fails after retries.
+    """
+    telemetry.count("sheets.calls")
+    with telemetry.timer(f"sheets.{getattr(func, '__name__', 'call')}"):
+        return rate_limit.get_scheduler().call(func, *args, **kwargs)
+
+
+def _serialize_refresh(creds) -> None:
+    """
+    Let only one thread refresh the shared access token at a time.
+
+    Threads that queued up behind a refresh skip their own once the token has changed.
+    """
+    lock = threading.Lock()
+    refresh = creds.refresh
+
+    def locked_refresh(request):
+        token = creds.token
+        with lock:
+            if creds.token == token:
+                refresh(request)
+
+    creds.refresh = locked_refresh
+
+
+class SheetsConnection:
+    """
+    Authorized client, spreadsheet and worksheet handles shared by every session of the process.
+
+    Also owns the local store and the replicator, so all sessions read the
+    same store and their writes reach Google Sheets through one queue.
+    """
+
+    def __init__(self, sheet_id:str, credentials_path:str=None, store=None, client=None):
+        """
+        Args:
+            sheet_id (str): The ID of the Google Sheet.
+            credentials_path (str): Path to a service account JSON file, defaults to st.secrets.google_api.
+            store: Local storage backend, defaults to ledger_store.SQLiteBackend().
+            client (gspread.Client): Already authorized client, e.g. a fake one for benchmarks.
+        """
+        if client is not None:
+            self.client = client
+        else:
+            if credentials_path is not None:
+                creds = Credentials.from_service_account_file(credentials_path, scopes=SCOPES)
+            else:
+                creds = Credentials.from_service_account_info(dict(st.secrets.google_api), scopes=SCOPES)
+            _serialize_refresh(creds)
+            self.client = gspread.authorize(creds)
+        http_client = getattr(self.client, "http_client", self.client)
+        session = getattr(http_client, "session", None)
+        if session is not None:
+            session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=POOL_SIZE))
+            session.hooks["response"].append(telemetry.record_response)
+        self.spreadsheet = safe_api_call(self.client.open_by_key, sheet_id)
+        self.replica = SheetsBackend(safe_api_call(self.spreadsheet.worksheets), safe_api_call, self.spreadsheet)
+        self.worksheets = self.replica.worksheets
+        self.store = store if store is not None else ledger_store.SQLiteBackend()
+        unhydrated = [ledger for ledger in ledger_store.LEDGERS if not self.store.is_hydrated(ledger)]
+        if unhydrated:
+            for ledger, records in self.replica.fetch_many(unhydrated).items():
+                self.store.replace(ledger, records)
+        if self.replica.legacy and not self.store.is_partitioned():
+            self.store.enqueue_partitioning()
+        else:
+            self.store.enqueue_archive(stale_only=True)
+        self.replicator = ledger_store.Replicator(self.replica, self.store)
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(sheet_id:str=None, credentials_path:str=None, store=None, client=None) -> SheetsConnection:
+    """
+    Return the process-wide connection to a Google Sheet, creating it on first use.
+    """
+    if sheet_id is None:
+        sheet_id = dict(st.secrets.db_info)["sheet_id"]
+    key = (sheet_id, credentials_path, store.db_path if store is not None else None, id(client) if client is not None else None)
+    with _connections_lock:
+        if key not in _connections:
+            _connections[key] = SheetsConnection(sheet_id, credentials_path, store, client)
+        return _connections[key]
 
 
 class SheetLogger:
@@ -12,76 +371,299 @@ class SheetLogger:
     A class to handle logging of spendings and income into Google Sheets.
     """
 
-    def __init__(self, credentials_path:str=None, sheet_id:str=None):
+    def __init__(self, credentials_path:str=None, sheet_id:str=None, store=None, client=None):
         """
         Initialize the SheetLogger with credentials and sheet ID.
 
+        Reads are served from a local store; Google Sheets is kept in sync as a
+        replica by a background thread. The client, worksheets, store and
+        replicator are shared by every SheetLogger of the process, and so are
+        the ledgers it reads (see compact_ledger): a new session only holds
+        references to them.
+
         Args:
             credentials_path (str): Path to the credentials JSON file.
             sheet_id (str): The ID of the Google Sheet.
+            store: Local storage backend, defaults to ledger_store.SQLiteBackend().
+            client (gspread.Client): Already authorized client, e.g. a fake one for benchmarks.
         """
-        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-        google_api = dict(st.secrets.google_api)
-        creds = Credentials.from_service_account_info(google_api, scopes=scopes)
-        client = gspread.authorize(creds)
-        if sheet_id is None:
-            sheet_id = db_info["sheet_id"]
-        self.sheet = client.open_by_key(sheet_id)
-        self.spendings_sheet = self.sheet.get_worksheet(0)
-        self.income_sheet = self.sheet.get_worksheet(1)
+        self.connection = get_connection(sheet_id, credentials_path, store, client)
+        self.sheet = self.connection.spreadsheet
+        self.replica = self.connection.replica
+        self.store = self.connection.store
+        self.replicator = self.connection.replicator
         self.cached_spendings = None
         self.cached_income = None
+        self.date_errors = {"spendings": [], "income": []}
+        self.conversion_error = None
 
     def safe_api_call(self, func, *args, **kwargs):
         """
         Safely call a Google Sheets API function with retry logic.
 
+        See safe_api_call.
+        """
+        return safe_api_call(func, *args, **kwargs)
+
+    @telemetry.timed("sheet.refresh")
+    def _refresh(self, ledgers:list) -> None:
+        """
+        Bring the cached ledgers up to date.
+
+        A ledger is taken again from the local store only when another session
+        has written to it, and is then built once for every session; rows
+        appended to the sheets since are picked up with one ranged read
+        covering the tails of the open partitions of every ledger. Closed
+        years are not read again; when a year has closed since the archive
+        was last written, its rewrite is queued.
+
+        The tails are read and stored while the replicator is kept from
+        applying writes, and are skipped while it has writes to apply or is
+        applying one: a row logged locally and already replicated would
+        otherwise be read back as new. Rows are only stored if their partition
+        still holds the number of rows the read started from.
+        """
+        for ledger in ledgers:
+            version = self.store.version(ledger)
+            cache = getattr(self, f"cached_{ledger}")
+            if cache is None or cache.version != version:
+                telemetry.cache("sheet.records", misses=1)
+                setattr(self, f"cached_{ledger}", compact_ledger.shared(self.store, ledger, version))
+            else:
+                telemetry.cache("sheet.records", hits=1)
+        if not self.replica.legacy and self.store.enqueue_archive(stale_only=True):
+            self.replicator.notify()
+        if self.replica.legacy or not self.replicator.lock.acquire(blocking=False):
+            return
+        try:
+            if self.replicator.pending():
+                return
+            known_rows = {
+                ledger_store.partition_key(ledger, partition): self.store.partition_count(ledger, partition)
+                for ledger in ledgers for partition in self.replica.partitions(ledger) if not ledger_store.is_closed(partition)
+            }
+            for key, new_records in self.replica.fetch_tails(known_rows).items():
+                if not new_records:
+                    continue
+                ledger, partition = ledger_store.split_key(key)
+                rows = [[record[column] for column in ledger_store.COLUMNS] for record in new_records]
+                if self.store.append(ledger, rows, partition=partition, expected=known_rows[key]):
+                    setattr(self, f"cached_{ledger}", compact_ledger.shared(self.store, ledger))
+        finally:
+            self.replicator.lock.release()
+
+    def _cached_rows(self, ledger:str, refresh:bool=True) -> compact_ledger.CompactLedger:
+        """
+        Return the cached ledger, topped up with rows appended to the sheet since. Shared, read-only.
+        """
+        if refresh or getattr(self, f"cached_{ledger}") is None:
+            self._refresh([ledger])
+        return getattr(self, f"cached_{ledger}")
+
+    def _patch_cache(self, ledger:str, patch) -> None:
+        """
+        Apply a local write to the cached ledger instead of reading it again, and share the result.
+
         Args:
-            func (callable): The API function to call.
-            *args: Positional arguments for the function.
-            **kwargs: Keyword arguments for the function.
+            ledger (str): 'spendings' or 'income'.
+            patch (callable): Returns the cached ledger with the write applied, None to drop the cache.
+        """
+        cache = getattr(self, f"cached_{ledger}")
+        version = self.store.version(ledger)
+        if cache is None or patch is None or cache.version != version - 1:
+            # Another session wrote in between, the cache is reloaded on the next fetch.
+            setattr(self, f"cached_{ledger}", None)
+            return
+        patched = patch(cache)
+        patched.version = version
+        setattr(self, f"cached_{ledger}", compact_ledger.publish(self.store, ledger, patched))
+
+    def _appends_at_end(self, ledger:str, rows:list[list]) -> bool:
+        """
+        Whether rows about to be appended land at the end of the ledger, after its latest partition.
+
+        Rows dated in an earlier year go to the end of that year's partition
+        instead, so the cached ledger cannot simply be extended.
+        """
+        partitions = [ledger_store.partition_of(row[2]) for row in rows]
+        last = self.store.last_partition(ledger)
+        return (last is None or partitions[0] >= last) and partitions == sorted(partitions)
+
+    def data_version(self) -> tuple:
+        """
+        Stamp that changes whenever either ledger changes, for memoizing derived data.
+        """
+        return (self.store.db_path, self.store.version("spendings"), self.store.version("income"))
+
+    def rollups(self) -> dict:
+        """
+        Materialized totals per day, month and type of both ledgers, rebuilt if found inconsistent.
 
         Returns:
-            Any: The result of the API call.
+            dict: {"spendings": ..., "income": ...}, see ledger_store.SQLiteBackend.rollups.
+        """
+        result = {}
+        for ledger in ledger_store.LEDGERS:
+            if not self.store.rollups_consistent(ledger):
+                self.store.rebuild_rollups(ledger)
+            result[ledger] = self.store.rollups(ledger)
+        return result
+
+    def convert_amounts(self) -> int:
+        """
+        Convert the amounts entered in other currencies to the base currency, in bulk.
 
-        Raises:
-            Exception: If the API call fails after retries.
+        Entries are saved without waiting for exchange rates; their amounts are
+        converted here, at the rate of their rate date, with one rate table
+        load per ledger, and kept in the local store. Rows without a known
+        rate are left for a later call and reported in self.conversion_error,
+        the others are converted regardless.
+
+        Returns:
+            int: Number of rows still waiting for a conversion.
         """
-        retries = 3
-        for attempt in range(retries):
+        waiting = 0
+        self.conversion_error = None
+        for ledger in ledger_store.LEDGERS:
+            rows = pd.DataFrame(self.store.unconverted(ledger), columns=["position", "amount", "currency", "date"])
+            if rows.empty:
+                continue
+            rows["amount"] = pd.to_numeric(rows["amount"], errors="coerce")
+            rows["date"] = pd.to_datetime(rows["date"], format=compact_ledger.DATE_FORMAT, errors="coerce")
+            # Rows with an unreadable amount or date wait until they are fixed.
+            valid = rows.dropna()
+            waiting += len(rows) - len(valid)
+            if valid.empty:
+                continue
             try:
-                return func(*args, **kwargs)
-            except gspread.exceptions.APIError as e:
-                if "Quota exceeded" in str(e) and attempt < retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    raise
+                with telemetry.timer("forex.convert_amounts"):
+                    bases = forex_conversion.convert_currencies(
+                        valid["amount"].to_numpy(), valid["currency"].to_numpy(), valid["date"].to_numpy(), ledger_store.BASE_CURRENCY
+                    )
+            except (ValueError, ConnectionError) as e:
+                self.conversion_error = e
+                waiting += len(valid)
+                continue
+            converted = np.isfinite(bases)
+            if not converted.all():
+                waiting += int((~converted).sum())
+                missing = sorted(set(valid["currency"].to_numpy()[~converted]))
+                fetch_error = forex_conversion.get_historical_rate_table().fetch_error
+                self.conversion_error = ValueError(f"No exchange rate is available for {', '.join(missing)} at some dates."
+                                                   + (f" Fetching rates failed: {fetch_error}" if fetch_error is not None else ""))
+            if converted.any():
+                self.store.set_base(ledger, list(zip(valid["position"].to_numpy()[converted].tolist(), bases[converted].tolist())))
+                self.replicator.notify()
+        return waiting
+
+    def _typed_frame(self, ledger:str, refresh:bool=True) -> pd.DataFrame:
+        """
+        The cached typed DataFrame of a ledger, built once per version for every session. Not to be modified.
+
+        Besides the ledger columns it holds the amounts in the base currency
+        under ledger_store.BASE_COLUMN, NaN for rows waiting for a conversion.
+        """
+        rows = self._cached_rows(ledger, refresh)
+        self.date_errors[ledger] = self._date_errors(ledger, rows)
+        return rows.frame()
+
+    def _date_errors(self, ledger:str, rows:compact_ledger.CompactLedger) -> list:
+        """
+        Malformed dates of a ledger with the worksheet and the row of that worksheet they sit in.
+        """
+        errors = rows.date_errors()
+        if not errors:
+            return errors
+        starts, partitions, start = [], [], 0
+        for partition, count in ([] if self.replica.legacy else self.store.partition_sizes(ledger)):
+            starts.append(start)
+            partitions.append(partition)
+            start += count
+        if not partitions:
+            return [{**error, "worksheet": TITLES[ledger]} for error in errors]
+        located = []
+        for error in errors:
+            index = max(bisect.bisect_right(starts, error["row"] - 2) - 1, 0)
+            located.append({**error, "worksheet": f"{TITLES[ledger]} {partitions[index]}", "row": error["row"] - starts[index]})
+        return located
+
+    def date_index(self, ledger:str, refresh:bool=False) -> date_index.DateIndex:
+        """
+        Sorted date index of a ledger for range queries and period summaries, rebuilt only when the ledger changed.
+
+        Its positions are rows of fetch_*(True, as_frame=True) fetched at the same version.
+        """
+        return self._cached_rows(ledger, refresh).date_index()
 
-    def fetch_spendings(self, conver_date:bool=False) -> list:
+    @telemetry.timed("sheet.fetch")
+    def _fetch(self, ledger:str, convert_date:bool, as_frame:bool, refresh:bool=True, shared:bool=False):
+        """
+        Return a ledger as a list of records or as a typed DataFrame.
+
+        Both are new objects the caller may modify, unless shared is set: the
+        typed DataFrame is then the one cached for every session, returned
+        without a copy and not to be modified. Malformed dates are reported in
+        self.date_errors[ledger] instead of raising.
+        """
+        if as_frame and shared and convert_date:
+            return self._typed_frame(ledger, refresh)
+        if as_frame:
+            frame = self._typed_frame(ledger, refresh).copy()
+            if not convert_date:
+                frame["Date"] = frame["Date"].dt.strftime(compact_ledger.DATE_FORMAT)
+            return frame
+        rows = self._cached_rows(ledger, refresh)
+        self.date_errors[ledger] = self._date_errors(ledger, rows)
+        return rows.records(convert_date)
+
+    def memory_report(self) -> list:
+        """
+        Memory held by the ledgers shared in the process, see compact_ledger.memory_report.
+        """
+        return compact_ledger.memory_report()
+
+    def fetch_spendings(self, conver_date:bool=False, as_frame:bool=False):
         """
         Fetch spendings data from the Google Sheet.
 
+        Args:
+            conver_date (bool): Parse the "Date" column into datetimes.
+            as_frame (bool): Return a typed DataFrame instead of a list of records.
+
         Returns:
-            list: List of spendings records.
+            list | pd.DataFrame: Spendings records.
         """
-        data = self.safe_api_call(self.spendings_sheet.get_all_records)
-        if conver_date:
-            for i in data:
-                i["Date"] = datetime.strptime(i["Date"], '%Y-%m-%d')
-        return data
+        return self._fetch("spendings", conver_date, as_frame)
 
-    def fetch_income(self, convert_date:bool=False) -> list:
+    def fetch_income(self, convert_date:bool=False, as_frame:bool=False):
         """
         Fetch income data from the Google Sheet.
 
+        Args:
+            convert_date (bool): Parse the "Date" column into datetimes.
+            as_frame (bool): Return a typed DataFrame instead of a list of records.
+
         Returns:
-            list: List of income records.
+            list | pd.DataFrame: Income records.
         """
-        data = self.safe_api_call(self.income_sheet.get_all_records)
-        if convert_date:
-            for i in data:
-                i["Date"] = datetime.strptime(i["Date"], '%Y-%m-%d')
-        return data
+        return self._fetch("income", convert_date, as_frame)
+
+    def fetch_all(self, convert_date:bool=False, as_frame:bool=False, shared:bool=False) -> tuple:
+        """
+        Fetch both ledgers together, checking the sheets for new rows with a single API call.
+
+        Args:
+            convert_date (bool): Parse the "Date" column into datetimes.
+            as_frame (bool): Return typed DataFrames instead of lists of records.
+            shared (bool): With convert_date and as_frame, return the DataFrames shared
+                by every session instead of copies. They must not be modified.
+
+        Returns:
+            tuple: (spendings records, income records)
+        """
+        self._refresh(list(ledger_store.LEDGERS))
+        return (self._fetch("spendings", convert_date, as_frame, refresh=False, shared=shared),
+                self._fetch("income", convert_date, as_frame, refresh=False, shared=shared))
 
     def log_spending(self, data: list[float, str, str, str], date_conversion:bool=False) -> None:
         """
@@ -93,13 +675,16 @@ class SheetLogger:
                 - date (str): The date of spending in the format DD/MM/YYYY.
                 - type (str): The type of spending.
                 - comments (str): Additional comments or notes.
+                - currency (str): Currency of the amount, optional (base currency).
+                - rate date (str): Date of the rate to convert the amount at, optional (the date).
         """
         if date_conversion:
             data[1] = str(data[1])
-        num = len(self.fetch_spendings())+1
-        data = [num] + data
-        self.spendings_sheet.append_row(data)
-        self.cached_spendings = None  # Invalidate cache
+        data = ledger_store.pad_row([None] + data)
+        at_end = self._appends_at_end("spendings", [data])
+        data = self.store.append("spendings", [data], replicate=True, number=True)[0]
+        self.replicator.notify()
+        self._patch_cache("spendings", (lambda cache: cache.appended([data])) if at_end else None)
 
     def log_income(self, data: list[float, str, str, str], date_conversion:bool=False) -> None:
         """
@@ -111,15 +696,77 @@ class SheetLogger:
                 - date (str): The date of income in the format DD/MM/YYYY.
                 - type (str): The type of income.
                 - comments (str): Additional comments or notes.
+                - currency (str): Currency of the amount, optional (base currency).
+                - rate date (str): Date of the rate to convert the amount at, optional (the date).
         """
         if date_conversion:
             data[1] = str(data[1])
-        num = len(self.fetch_income())+1
-        data = [num] + data
-        self.income_sheet.append_row(data)
-        self.cached_income = None  # Invalidate cache
+        data = ledger_store.pad_row([None] + data)
+        at_end = self._appends_at_end("income", [data])
+        data = self.store.append("income", [data], replicate=True, number=True)[0]
+        self.replicator.notify()
+        self._patch_cache("income", (lambda cache: cache.appended([data])) if at_end else None)
     
-    def update_spenings_sheet(self, changes:list[list[int, int, str]]) -> bool:
+    def log_rows(self, ledger:str, rows:list[list]) -> None:
+        """
+        Log many entries at once: one local transaction and one append_rows call.
+
+        Args:
+            ledger (str): 'spendings' or 'income'.
+            rows (list): [amount, date, type, comments, currency, rate date] lists, see log_spending.
+        """
+        if not rows:
+            return
+        rows = [ledger_store.pad_row([None] + list(row)) for row in rows]
+        at_end = self._appends_at_end(ledger, rows)
+        rows = self.store.append(ledger, rows, replicate=True, number=True)
+        self.replicator.notify()
+        self._patch_cache(ledger, (lambda cache: cache.appended(rows)) if at_end else None)
+
+    def flush(self) -> None:
+        """
+        Block until every buffered write has been flushed to Google Sheets.
+        """
+        self.replicator.wait()
+
+    def pending_writes(self) -> int:
+        """
+        Number of writes saved locally but not yet applied to Google Sheets.
+        """
+        return self.replicator.pending()
+
+    def replication_error(self) -> Exception:
+        """
+        Error of the last failed attempt to write to Google Sheets, None once a write succeeds.
+        """
+        return self.replicator.last_error
+
+    def dead_letters(self) -> list:
+        """
+        Writes Google Sheets rejected for good. Their worksheets are rebuilt from the local rows.
+
+        Returns:
+            list: See SQLiteBackend.dead_letters.
+        """
+        return self.store.dead_letters()
+
+    def halted_worksheets(self) -> list:
+        """
+        Replica keys of the worksheets Google Sheets writes are halted for, see ledger_store.Replicator.
+        """
+        return self.store.halted()
+
+    def rebuild_worksheet(self, key:str) -> None:
+        """
+        Rewrite a worksheet with the local rows and resume writing to it.
+
+        Args:
+            key (str): Replica key, e.g. 'spendings:2024'.
+        """
+        self.store.enqueue_rebuild(key)
+        self.replicator.notify()
+
+    def update_spenings_sheet(self, changes:list[list[int, int, str]], numbers:dict=None) -> int:
         """
             Update the spendings sheet with the provided changes.
             Args:
@@ -128,12 +775,24 @@ class SheetLogger:
                     - row (int): Row of the data
                     - column (int): Column of the data
                     - value (str): Value
+            numbers (dict): Number of the transaction each row held when the changes
+                were made, to find the rows again if other writes moved them
+                (see SQLiteBackend.update).
+
+            Returns:
+                int: Number of writes queued for Google Sheets, one per year
+                    partition written to plus the archive rewrite when a closed
+                    year's totals changed.
         """
-        for i in changes:
-            self.spendings_sheet.update_cell(i[0], i[1], i[2])
-        return True
+        if not changes:
+            return 0
+        changes = [list(change) for change in changes]
+        writes = self.store.update("spendings", changes, replicate=True, numbers=numbers)
+        self.replicator.notify()
+        self._patch_cache("spendings", lambda cache: cache.with_changes(changes))
+        return writes
     
-    def update_income_sheet(self, changes:list[list[int, int, str]]) -> bool:
+    def update_income_sheet(self, changes:list[list[int, int, str]], numbers:dict=None) -> int:
         """
             Update the income sheet with the provided changes.
             Args:
@@ -142,22 +801,76 @@ class SheetLogger:
                     - row (int): Row of the data   
                     - column (int): Column of the data
                     - value (str): Value
+            numbers (dict): Number of the transaction each row held when the changes
+                were made, to find the rows again if other writes moved them
+                (see SQLiteBackend.update).
+
+            Returns:
+                int: Number of writes queued for Google Sheets, one per year
+                    partition written to plus the archive rewrite when a closed
+                    year's totals changed.
+        """
+        if not changes:
+            return 0
+        changes = [list(change) for change in changes]
+        writes = self.store.update("income", changes, replicate=True, numbers=numbers)
+        self.replicator.notify()
+        self._patch_cache("income", lambda cache: cache.with_changes(changes))
+        return writes
+    def delete_spendings_rows(self, rows:list[int], numbers:dict=None) -> int:
+        """
+        Delete rows from the spendings sheet.
+
+        Args:
+            rows (list): Sheet rows to delete (row 2 is the first record).
+            numbers (dict): Number of the transaction each row held, see update_spenings_sheet.
+
+        Returns:
+            int: Number of writes queued for Google Sheets, one per year
+                partition written to plus the archive rewrite when a closed
+                year lost rows.
+        """
+        if not rows:
+            return 0
+        rows = list(rows)
+        writes = self.store.delete("spendings", rows, replicate=True, numbers=numbers)
+        self.replicator.notify()
+        self._patch_cache("spendings", lambda cache: cache.without_rows(rows))
+        return writes
+
+    def delete_income_rows(self, rows:list[int], numbers:dict=None) -> int:
         """
-        for i in changes:
-            self.income_sheet.update_cell(i[0], i[1], i[2])
-        return True
+        Delete rows from the income sheet.
+
+        Args:
+            rows (list): Sheet rows to delete (row 2 is the first record).
+            numbers (dict): Number of the transaction each row held, see update_spenings_sheet.
+
+        Returns:
+            int: Number of writes queued for Google Sheets, one per year
+                partition written to plus the archive rewrite when a closed
+                year lost rows.
+        """
+        if not rows:
+            return 0
+        rows = list(rows)
+        writes = self.store.delete("income", rows, replicate=True, numbers=numbers)
+        self.replicator.notify()
+        self._patch_cache("income", lambda cache: cache.without_rows(rows))
+        return writes
+
     def clear_spending_sheet(self) -> None:
         """
         Clear the spendings sheet except for the first row.
         """
-        rows_to_clear = len(self.fetch_spendings())
-        if rows_to_clear > 0:
-            self.spendings_sheet.delete_rows(2, rows_to_clear + 1)
+        self.store.clear("spendings", replicate=True)
+        self.replicator.notify()
+        self._patch_cache("spendings", lambda cache: compact_ledger.CompactLedger.from_rows([]))
     def clear_income_sheet(self) -> None:
         """
         Clear the income sheet except for the first row.
         """
-        rows_to_clear = len(self.fetch_income())
-        if rows_to_clear > 0:
-            self.income_sheet.delete_rows(2, rows_to_clear + 1)
+        self.store.clear("income", replicate=True)
+        self.replicator.notify()
+        self._patch_cache("income", lambda cache: compact_ledger.CompactLedger.from_rows([]))
 
@@ -0,0 +1,167 @@
+#Per-rerun performance instrumentation
+import collections
+import contextlib
+import functools
+import threading
+import time
+from datetime import datetime
+
+HISTORY_SIZE = 50
+
+
+class Run:
+    """
+    Timings, counters and cache hits recorded during one script run.
+    """
+
+    def __init__(self, name:str):
+        self.name = name
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.interrupted = False
+        self.stages = {}
+        self.counters = {}
+        self.caches = {}
+        self.lock = threading.Lock()
+
+    def add_stage(self, stage:str, seconds:float) -> None:
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_counter(self, name:str, value) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_cache(self, name:str, hits:int, misses:int) -> None:
+        with self.lock:
+            entry = self.caches.setdefault(name, [0, 0])
+            entry[0] += hits
+            entry[1] += misses
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "name": self.name,
+                "started": self.started.isoformat(timespec="milliseconds"),
+                "elapsed": self.elapsed if self.elapsed is not None else time.perf_counter() - self.start,
+                "interrupted": self.interrupted,
+                "stages": {stage: {"calls": calls, "seconds": seconds} for stage, (calls, seconds) in self.stages.items()},
+                "counters": dict(self.counters),
+                "caches": {
+                    name: {"hits": hits, "misses": misses, "ratio": hits / (hits + misses) if hits + misses else None}
+                    for name, (hits, misses) in self.caches.items()
+                },
+            }
+
+
+_local = threading.local()
+_background = Run("background")
+_history = collections.deque(maxlen=HISTORY_SIZE)
+_history_lock = threading.Lock()
+
+
+def current() -> Run:
+    """
+    The run of the calling thread; work done outside a run (background threads) goes to one shared run.
+    """
+    return getattr(_local, "run", None) or _background
+
+
+def _finish(run:Run, interrupted:bool) -> dict:
+    run.elapsed = time.perf_counter() - run.start
+    run.interrupted = interrupted
+    with _history_lock:
+        _history.append(run)
+    return run.to_dict()
+
+
+def start_run(name:str) -> Run:
+    """
+    Start recording a script run on the calling thread.
+
+    A run left open by the previous rerun of the thread (stopped by
+    st.rerun or st.switch_page) is closed and kept as interrupted.
+    """
+    previous = getattr(_local, "run", None)
+    if previous is not None:
+        _finish(previous, True)
+    _local.run = Run(name)
+    return _local.run
+
+
+def end_run() -> dict:
+    """
+    Stop recording the run of the calling thread and keep it in the history.
+
+    Returns:
+        dict: The run, see Run.to_dict. None when no run was started.
+    """
+    run = getattr(_local, "run", None)
+    if run is None:
+        return None
+    _local.run = None
+    return _finish(run, False)
+
+
+@contextlib.contextmanager
+def timer(stage:str):
+    """
+    Time a block of code as one call of a stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current().add_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage:str):
+    """
+    Decorator timing every call of a function as a stage.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name:str, value=1) -> None:
+    current().add_counter(name, value)
+
+
+def cache(name:str, hits:int=0, misses:int=0) -> None:
+    current().add_cache(name, hits, misses)
+
+
+def record_response(response, *args, **kwargs) -> None:
+    """
+    requests response hook counting requests and bytes sent and received per host.
+    """
+    host = response.request.url.split("/")[2] if response.request is not None else "unknown"
+    body = response.request.body if response.request is not None else None
+    run = current()
+    run.add_counter(f"http.{host}.requests", 1)
+    run.add_counter(f"http.{host}.bytes_in", len(response.content or b""))
+    run.add_counter(f"http.{host}.bytes_out", len(body) if body else 0)
+
+
+def history() -> list:
+    """
+    The last HISTORY_SIZE runs, oldest first.
+    """
+    with _history_lock:
+        runs = list(_history)
+    return [run.to_dict() for run in runs]
+
+
+def background() -> dict:
+    """
+    Everything recorded outside a run since the process started.
+    """
+    return _background.to_dict()
@@ -1,39 +1,167 @@
-from framework import sheet
+import numpy as np
+import pandas as pd
+from framework import ledger_store, sheet
+
+
+def _frame(data) -> pd.DataFrame:
+    """
+    Build a columnar frame, one list comprehension per column (much faster than from_records on dicts).
+    """
+    if isinstance(data, pd.DataFrame):
+        return data.reset_index(drop=True)
+    data = list(data)
+    columns = list(dict.fromkeys(key for record in data[:1] for key in record))
+    return pd.DataFrame({column: [record.get(column) for record in data] for column in columns})
+
+
+def _normalise(frame:pd.DataFrame, column:str) -> pd.Series:
+    """
+    Bring a column to one comparable dtype: numbers to float, dates to datetime64, the rest to str.
+
+    Columns already of that dtype, as in the typed frames of SheetLogger.fetch_*, are returned as they are.
+    """
+    values = frame[column] if column in frame else pd.Series([None] * len(frame), dtype=object)
+    if column in ("Number", "Amount"):
+        return values if pd.api.types.is_numeric_dtype(values) else pd.to_numeric(values, errors="coerce")
+    elif column == "Date":
+        return values if pd.api.types.is_datetime64_any_dtype(values) else pd.to_datetime(values, errors="coerce")
+    if pd.api.types.is_string_dtype(values) and pd.api.types.infer_dtype(values) in ("string", "empty") and not values.isna().any():
+        return values
+    return values.fillna("").astype(str)
+
+
+def _cell(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _align(new:pd.DataFrame, original:pd.DataFrame) -> tuple:
+    """
+    Pair rows of the edited table with rows of the original table.
+
+    Rows are paired by their "Number" as long as it is unique in the original
+    table, otherwise by position (extra rows at the end being added or deleted).
+
+    Returns:
+        tuple: (new positions, original positions, added new positions, deleted original positions)
+    """
+    n_new, n_original = len(new), len(original)
+    if "Number" not in new or "Number" not in original or not original["Number"].is_unique:
+        paired = min(n_new, n_original)
+        return (np.arange(paired), np.arange(paired), np.arange(paired, n_new), np.arange(paired, n_original))
+    original_numbers = pd.Index(original["Number"])
+    new_numbers = new["Number"].to_numpy()
+    matches = original_numbers.get_indexer(new_numbers)
+    # A number repeated in the edited table only pairs with the original once.
+    matched = (matches >= 0) & ~pd.Series(matches).duplicated().to_numpy()
+    kept = np.zeros(n_original, dtype=bool)
+    kept[matches[matched]] = True
+    deleted = np.flatnonzero(~kept)
+    return (np.flatnonzero(matched), matches[matched], np.flatnonzero(~matched), deleted)
+
+
+def diff_data(new_data, original_data, rows:list=None) -> dict:
+    """
+    Compute the difference between an edited table and the original one column by column.
+
+    args:
+        - new_data (list | DataFrame): updated data
+        - original_data (list | DataFrame): original data
+        - rows (list): sheet row of each original record, for a window of the sheet; rows 2, 3, ... by default
+
+    returns:
+        - dict:
+            - changes (list): [row, column, value] of every changed cell, rows and columns as in the sheet
+            - added (list): records only present in the updated data
+            - deleted (list): sheet rows only present in the original data
+    """
+    new, original = _frame(new_data), _frame(original_data)
+    sheet_rows = np.arange(2, len(original) + 2) if rows is None else np.asarray(rows, dtype=int)
+    # Derived columns (e.g. the amounts in the base currency) are not written back.
+    present = original.columns if len(original.columns) else new.columns
+    columns = [column for column in ledger_store.COLUMNS if column in present]
+    new_positions, original_positions, added, deleted = _align(new, original)
+
+    changed = np.zeros((len(new_positions), len(columns)), dtype=bool)
+    new_columns = []
+    for j, column in enumerate(columns):
+        new_column = _normalise(new, column).iloc[new_positions].reset_index(drop=True)
+        original_column = _normalise(original, column).iloc[original_positions].reset_index(drop=True)
+        changed[:, j] = (new_column.ne(original_column) & ~(new_column.isna() & original_column.isna())).to_numpy()
+        new_columns.append(new_column)
+    rows, cols = np.nonzero(changed)
+    # One positional lookup per column rather than per changed cell.
+    values = [None] * len(rows)
+    for j, new_column in enumerate(new_columns):
+        picked = np.flatnonzero(cols == j)
+        for i, value in zip(picked, new_column.iloc[rows[picked]]):
+            values[i] = _cell(value)
+    changes = [
+        [int(sheet_rows[original_positions[row]]), ledger_store.COLUMNS.index(columns[column]) + 1, value]
+        for row, column, value in zip(rows, cols, values)
+    ]
+    return {
+        "changes": changes,
+        "added": new.iloc[added].to_dict("records"),
+        "deleted": [int(row) for row in sheet_rows[deleted]],
+    }
+
+
+def _numbers(original_data, rows:list=None) -> dict:
+    """
+    Number of the transaction on each sheet row of the original data, for rows holding one.
+    """
+    original = _frame(original_data)
+    if "Number" not in original:
+        return None
+    sheet_rows = np.arange(2, len(original) + 2) if rows is None else np.asarray(rows, dtype=int)
+    numbers = _normalise(original, "Number")
+    return {int(row): number for row, number in zip(sheet_rows.tolist(), numbers.tolist()) if not pd.isna(number)}
+
 
 def compare_data(new_data:list[dict], original_data:list[dict]) -> list:
     """
     args:
         - new_data (list): updated data
         - original_data (list): original data
+
+    returns:
+        - list: [row, column, value] of every changed cell of the rows present in both
     """
-    if len(new_data) != len(original_data):
-        raise ValueError("Error, different length of data")
-    elif new_data == original_data:
-        return []
-    abnormals = []
-    for i in range(len(new_data)):
-        new_dict =  new_data[i]
-        original_dict = original_data[i]
-        for j in range(len(new_dict)):
-            if new_dict[(list(new_dict.keys()))[j]] != original_dict[(list(original_dict.keys()))[j]]:
-                abnormals.append([i+2, j+1, new_dict[(list(new_dict.keys()))[j]]])
-    return abnormals
-
-def update_history(data_type:str, logger:sheet.SheetLogger, new_data:list[list], original_data:list[list]) -> bool:
+    return diff_data(new_data, original_data)["changes"]
+
+def update_history(data_type:str, logger:sheet.SheetLogger, new_data:list[list], original_data:list[list], rows:list=None) -> int:
     """
     args:
         - type (str): type of data -> spendings, income
         - new_data (list): updated data
         - original_data (list): original data
+        - rows (list): sheet row of each original record when only a window of the sheet was edited
+
+    Rows are found again by their Number when saving, so rows moved by writes
+    made since the original data was read still receive their own changes.
+
+    returns:
+        - int: number of writes queued for Google Sheets, 0 when nothing changed
+
+    raises:
+        - ValueError: if a row moved and cannot be told apart by its Number
     """
-    abnormals = compare_data(new_data, original_data)
-    if abnormals == []:
-        return False
     if data_type == "spendings":
-        logger.update_spenings_sheet(abnormals)
-        return True
+        update, delete, log = logger.update_spenings_sheet, logger.delete_spendings_rows, logger.log_spending
     elif data_type == "income":
-        logger.update_income_sheet(abnormals)
-        return True
+        update, delete, log = logger.update_income_sheet, logger.delete_income_rows, logger.log_income
     else:
-        raise KeyError("Invalid type of data, must be spendings or income.")
\ No newline at end of file
+        raise KeyError("Invalid type of data, must be spendings or income.")
+    diff = diff_data(new_data, original_data, rows)
+    numbers = _numbers(original_data, rows) if diff["changes"] or diff["deleted"] else None
+    writes = update(diff["changes"], numbers) + delete(diff["deleted"], numbers)
+    for record in diff["added"]:
+        amount, date, transaction_type, comments, currency, rate_date = (
+            _cell(record.get(key)) for key in ("Amount", "Date", "Type", "Comments", "Currency", "Rate Date")
+        )
+        log([amount, ledger_store.cell_value(date), transaction_type, comments or "", currency or None, rate_date or None])
+    return writes + len(diff["added"])
@@ -1,7 +1,10 @@
 import streamlit as st
-import json
+import math
 import pandas as pd
-from framework import nav_bar, sheet, authentication, update_history, log
+from datetime import date, timedelta
+from framework import nav_bar, sheet, authentication, update_history, log, aggregation, telemetry, date_index, settings_store, forex_conversion, ledger_store
+
+telemetry.start_run("main")
 
 if "log" not in st.session_state:
     st.session_state["log"] = log.MasterLogger()
@@ -10,41 +13,92 @@ nav_bar.NavBar().render()
 
 st.title("Welcome to the Spendings Tracker App", anchor=None)
 
-def total_balance(spendings_history, income_history) -> None:
+def money(amount:float, currency:str) -> str:
+    return f"${amount:.2f}" if currency == "USD" else f"{amount:.2f} {currency}"
+
+@telemetry.timed("render.total_balance")
+def total_balance(summary:dict, currency:str="USD") -> None:
     st.header("Total Balance")
     total_balance_cols = st.columns(3)
-    if spendings_history:
-        total_spendings = sum([i["Amount"] for i in spendings_history])
-        total_balance_cols[0].metric("Total Spendings", f"${total_spendings:.2f}", f"${spendings_history[-1]['Amount']:.2f}", delta_color="inverse")
+    spendings_last, income_last = summary["spendings_last"], summary["income_last"]
+    if spendings_last is not None:
+        total_balance_cols[0].metric("Total Spendings", money(summary['spendings_total'], currency), money(spendings_last, currency), delta_color="inverse")
     else:
-        total_balance_cols[0].metric("Total Spendings", "$0.00")
+        total_balance_cols[0].metric("Total Spendings", money(0, currency))
         total_balance_cols[0].write("No spendings history available.")
-    if income_history:
-        total_income = sum([i["Amount"] for i in income_history])
-        total_balance_cols[1].metric("Total Income", f"${total_income:.2f}", f"${income_history[-1]['Amount']:.2f}", delta_color="normal")
-        total_balance_cols[2].metric("Net Income", f"${total_income-total_spendings:.2f}", f"${income_history[-1]['Amount']-spendings_history[-1]['Amount']:.2f}", delta_color="normal")
+    if income_last is not None:
+        total_balance_cols[1].metric("Total Income", money(summary['income_total'], currency), money(income_last, currency), delta_color="normal")
+        total_balance_cols[2].metric("Net Income", money(summary['income_total']-summary['spendings_total'], currency), money(income_last-(spendings_last or 0), currency), delta_color="normal")
     else:
-        total_balance_cols[1].metric("Total Income", "$0.00")
+        total_balance_cols[1].metric("Total Income", money(0, currency))
         total_balance_cols[1].write("No income history available.")
-        total_balance_cols[2].metric("Net Income", "$0.00")
+        total_balance_cols[2].metric("Net Income", money(0, currency))
         total_balance_cols[2].write("No net income history available.")
 
-def transactions_data_editor(spendings_history:list[dict], income_history:list[dict]) -> None:
+def transactions_window(history:pd.DataFrame, key:str, types:list, index:date_index.DateIndex=None) -> pd.DataFrame:
+    """
+        Filter a history by date range, type and amount, and return one page of it.
+
+        Amounts are filtered in the base currency, so rows in other currencies
+        waiting for an exchange rate are left out while an amount filter is set.
+
+        Args:
+        - history (DataFrame): Spendings or income data, indexed by position in the sheet.
+        - key (str): Prefix of the widget keys.
+        - types (list): Transaction types offered in the type filter.
+        - index (DateIndex): Date index of the history, to look the date range up by binary search.
+
+        Returns:
+        - DataFrame: A copy of the rows of the current page, still indexed by position in the sheet.
     """
-        Edit transactions data.
-        
+    filter_cols = st.columns([2, 2, 1, 1, 1, 1])
+    date_range = filter_cols[0].date_input("Date Range", value=(), format="DD/MM/YYYY", key=f"{key}_dates")
+    selected_types = filter_cols[1].multiselect("Types", types, key=f"{key}_types")
+    min_amount = filter_cols[2].number_input(f"Min Amount ({ledger_store.BASE_CURRENCY})", min_value=0.0, value=None, step=0.01, key=f"{key}_min")
+    max_amount = filter_cols[3].number_input(f"Max Amount ({ledger_store.BASE_CURRENCY})", min_value=0.0, value=None, step=0.01, key=f"{key}_max")
+    page_size = filter_cols[4].selectbox("Per Page", [50, 100, 500], key=f"{key}_page_size")
+    matches = history
+    if len(date_range) > 0 and index is not None:
+        matches = index.select(history, date_range[0], date_range[-1])
+    elif len(date_range) > 0:
+        matches = history[(history["Date"] >= pd.Timestamp(date_range[0])) & (history["Date"] <= pd.Timestamp(date_range[-1]))]
+    mask = pd.Series(True, index=matches.index)
+    if selected_types:
+        mask &= matches["Type"].isin(selected_types)
+    if min_amount is not None:
+        mask &= matches[ledger_store.BASE_COLUMN] >= min_amount
+    if max_amount is not None:
+        mask &= matches[ledger_store.BASE_COLUMN] <= max_amount
+    matches = matches[mask]
+    pages = max(1, math.ceil(len(matches)/page_size))
+    page = filter_cols[5].number_input("Page", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page")
+    st.caption(f"{len(matches)} of {len(history)} transactions, page {page} of {pages}")
+    return matches.iloc[(page-1)*page_size:page*page_size].copy()
+
+@telemetry.timed("render.transactions_data_editor")
+@st.fragment
+def transactions_data_editor(spendings_history:pd.DataFrame, income_history:pd.DataFrame, spendings_index:date_index.DateIndex=None, income_index:date_index.DateIndex=None) -> None:
+    """
+        Edit transactions data one filtered page at a time.
+
+        Only the page is sent to the browser and diffed on save; its rows are
+        written back to their own rows of the sheet.
+
         Args:
-        - spendings_history (list): List of spendings data.
-        - income_history (list): List of income data.
+        - spendings_history (DataFrame): Spendings data, shared by every session and not to be modified.
+        - income_history (DataFrame): Income data, shared by every session and not to be modified.
+        - spendings_index (DateIndex): Date index of the spendings data.
+        - income_index (DateIndex): Date index of the income data.
     """
-    with open("settings/transaction_types.json", "r"):
-        transaction_types = json.load(open("settings/transaction_types.json", "r"))            
+    transaction_types = settings_store.transaction_types()
+    currencies = list(dict.fromkeys(settings_store.currencies()))
     st.header("Transactions")
     history_tabs = st.tabs(["Spendings", "Income"])
     with history_tabs[0]:
         st.subheader("Spendings History")
-        if spendings_history:
-            edited_spenings = st.data_editor(spendings_history, use_container_width=True, column_config={
+        if len(spendings_history):
+            spendings_window = transactions_window(spendings_history, "spendings", transaction_types["spending_types"], spendings_index)
+            edited_spenings = st.data_editor(spendings_window, use_container_width=True, hide_index=True, column_config={
                 "Number":st.column_config.Column(disabled=True),
                 "Amount":st.column_config.NumberColumn(required=True, min_value=0, step=0.01),
                 "Date":st.column_config.DateColumn(required=True),
@@ -53,19 +107,27 @@ def transactions_data_editor(spendings_history:list[dict], income_history:list[d
                 options=transaction_types["spending_types"],
                 required=True,),
                 "Comments":st.column_config.TextColumn(),
+                "Currency":st.column_config.SelectboxColumn(width="small", options=currencies),
+                "Rate Date":st.column_config.Column(disabled=True),
+                ledger_store.BASE_COLUMN:st.column_config.NumberColumn(disabled=True, format="%.2f"),
             })
             update_spendings = st.button("Update Spendings", type="primary")
             if update_spendings:
-                updated_spendings = update_history.update_history("spendings", st.session_state["sheet"], edited_spenings, spendings_history)
+                try:
+                    updated_spendings = update_history.update_history("spendings", st.session_state["sheet"], edited_spenings, spendings_window, rows=spendings_window.index + 2)
+                except ValueError as e:
+                    st.warning(f"Spendings history not saved: {e}")
+                    updated_spendings = 0
                 if updated_spendings:
-                    st.session_state["log"].log_info("[UPDATED] Spendings history updated.")
+                    st.session_state["log"].log_info(f"[UPDATED] Spendings history updated ({updated_spendings} write(s) queued for Google Sheets).")
                     st.rerun(scope="app")
         else:
             st.warning("No spendings history available.")
     with history_tabs[1]:
         st.subheader("Income History")
-        if income_history:
-            edited_income = st.data_editor(income_history, use_container_width=True, column_config={
+        if len(income_history):
+            income_window = transactions_window(income_history, "income", transaction_types["income_types"], income_index)
+            edited_income = st.data_editor(income_window, use_container_width=True, hide_index=True, column_config={
                 "Number":st.column_config.Column(disabled=True),
                 "Amount":st.column_config.NumberColumn(required=True, min_value=0, step=0.01),
                 "Date":st.column_config.DateColumn(required=True),
@@ -73,83 +135,97 @@ def transactions_data_editor(spendings_history:list[dict], income_history:list[d
                 width="small",
                 options=transaction_types["income_types"],
                 required=True),
-                "Comments":st.column_config.TextColumn()
+                "Comments":st.column_config.TextColumn(),
+                "Currency":st.column_config.SelectboxColumn(width="small", options=currencies),
+                "Rate Date":st.column_config.Column(disabled=True),
+                ledger_store.BASE_COLUMN:st.column_config.NumberColumn(disabled=True, format="%.2f"),
             })
             update_income = st.button("Update Income", type="primary")
             if update_income:
-                updated_income = update_history.update_history("income", st.session_state["sheet"], edited_income, income_history)
+                try:
+                    updated_income = update_history.update_history("income", st.session_state["sheet"], edited_income, income_window, rows=income_window.index + 2)
+                except ValueError as e:
+                    st.warning(f"Income history not saved: {e}")
+                    updated_income = 0
                 if updated_income:
-                    st.session_state["log"].log_info("[UPDATED] Income history updated.")
+                    st.session_state["log"].log_info(f"[UPDATED] Income history updated ({updated_income} write(s) queued for Google Sheets).")
                     st.rerun(scope="app")
         else:
             st.warning("No income history available.")
 
 
-def net_spending_area_chart(spendings_history, income_history):
+@telemetry.timed("render.period_summary")
+@st.fragment
+def period_summary(spendings_index:date_index.DateIndex, income_index:date_index.DateIndex, currency:str="USD", rate:float=1.0) -> None:
     """
-    Display an area chart for net spending over time.
+    Display totals and a chart of spendings and income per month, quarter or year over a date range.
 
     Args:
-        spendings_history (list): List of spendings data.
-        income_history (list): List of income data.
+        spendings_index (DateIndex): Date index of the spendings data.
+        income_index (DateIndex): Date index of the income data.
+        currency (str): Currency the amounts are shown in.
+        rate (float): Rate from the base currency to the display currency.
     """
-    if spendings_history and income_history:
-        spendings_df = pd.DataFrame(spendings_history, columns=["Amount", "Date", "Type", "Comments"])
-        income_df = pd.DataFrame(income_history, columns=["Amount", "Date", "Type", "Comments"])
+    if not len(spendings_index) and not len(income_index):
+        return
+    st.header("Period Summary")
+    today = date.today()
+    ranges = {
+        "All Time": (None, None),
+        "This Month": (today.replace(day=1), today),
+        "Last 90 Days": (today - timedelta(days=89), today),
+        "This Year": (today.replace(month=1, day=1), today),
+    }
+    period_cols = st.columns([2, 1])
+    start, end = ranges[period_cols[0].segmented_control("Range", list(ranges), default="All Time") or "All Time"]
+    period = period_cols[1].selectbox("Group By", list(date_index.PERIODS), format_func=str.capitalize)
+    spendings_total, income_total = spendings_index.total(start, end) * rate, income_index.total(start, end) * rate
+    period_metric_cols = st.columns(3)
+    period_metric_cols[0].metric("Spendings", money(spendings_total, currency), f"{spendings_index.count(start, end)} transaction(s)", delta_color="off")
+    period_metric_cols[1].metric("Income", money(income_total, currency), f"{income_index.count(start, end)} transaction(s)", delta_color="off")
+    period_metric_cols[2].metric("Net Income", money(income_total - spendings_total, currency))
+    summary = date_index.period_summary(spendings_index, income_index, period, start, end) * rate
+    if len(summary):
+        st.bar_chart(summary[["Spendings", "Income"]], stack=False)
 
-        spendings_df["Amount"] = spendings_df["Amount"].astype(float)
-        income_df["Amount"] = income_df["Amount"].astype(float)
 
-        spendings_by_date = spendings_df.groupby("Date")["Amount"].sum()
-        income_by_date = income_df.groupby("Date")["Amount"].sum()
-
-        net_spending_by_date = spendings_by_date.subtract(income_by_date, fill_value=0).reset_index()
-        net_spending_by_date.columns = ["Date", "Net Spending"]
+@telemetry.timed("render.net_spending_area_chart")
+def net_spending_area_chart(summary:dict):
+    """
+    Display an area chart for net spending over time.
 
+    Args:
+        summary (dict): Dashboard figures from aggregation.rollup_summary_cached.
+    """
+    if summary["spendings_last"] is not None and summary["income_last"] is not None:
         st.subheader("Net Spending Over Time")
-        st.area_chart(net_spending_by_date.set_index("Date"))
+        st.area_chart(summary["net_by_date"])
 
 
-def display_spending_by_category(spendings_history):
+@telemetry.timed("render.display_spending_by_category")
+def display_spending_by_category(summary:dict):
     """
     Display a bar chart of spending amounts by category.
 
     Args:
-        spendings_history (list): List of spendings data.
+        summary (dict): Dashboard figures from aggregation.rollup_summary_cached.
     """
-    if spendings_history:
-        amount = {j:0 for j in list(set([i["Type"] for i in spendings_history]))}
-        for i in spendings_history:
-            amount[i["Type"]]+=(i["Amount"])
-        spendings_df = pd.DataFrame(
-            {
-                "Type": amount.keys(),
-                "Amount $USD": amount.values()
-            }
-        )
-        st.subheader("Income by Category")
-        st.bar_chart(spendings_df, x="Type", y="Amount $USD")
+    if summary["spendings_last"] is not None:
+        st.subheader("Spendings by Category")
+        st.bar_chart(summary["spendings_by_type"], x="Type", y="Amount")
 
 
-def display_income_by_category(income_history):
+@telemetry.timed("render.display_income_by_category")
+def display_income_by_category(summary:dict):
     """
     Display a bar chart of income amounts by category.
 
     Args:
-        income_history (list): List of income data.
+        summary (dict): Dashboard figures from aggregation.rollup_summary_cached.
     """
-    if income_history:
-        amount = {j:0 for j in list(set([i["Type"] for i in income_history]))}
-        for i in income_history:
-            amount[i["Type"]]+=(i["Amount"])
-        income_df = pd.DataFrame(
-            {
-                "Type": amount.keys(),
-                "Amount $USD": amount.values()
-            }
-        )
+    if summary["income_last"] is not None:
         st.subheader("Income by Category")
-        st.bar_chart(income_df, x="Type", y="Amount $USD")
+        st.bar_chart(summary["income_by_type"], x="Type", y="Amount")
 
 
 
@@ -166,12 +242,37 @@ else:
     if "log" not in st.session_state:
         st.session_state["log"] = log.MasterLogger()
 
-    income_history = st.session_state["sheet"].fetch_income(True)
-    spendings_history = st.session_state["sheet"].fetch_spendings(True)
-    total_balance(spendings_history, income_history)
-    transactions_data_editor(spendings_history, income_history)
-    net_spending_area_chart(spendings_history, income_history)
-    display_spending_by_category(spendings_history)
-    display_income_by_category(income_history)
-
+    waiting_conversions = st.session_state["sheet"].convert_amounts()
+    if waiting_conversions:
+        st.warning(f"{waiting_conversions} transaction(s) in other currencies are waiting for exchange rates and are left out of the totals."
+                   + (f" {st.session_state['sheet'].conversion_error}" if st.session_state["sheet"].conversion_error is not None else ""))
+    display_currency = st.selectbox("Display Currency", list(dict.fromkeys(settings_store.currencies())), key="display_currency")
+    display_rate = 1.0
+    if display_currency != ledger_store.BASE_CURRENCY:
+        try:
+            display_rate = forex_conversion.convert_currency(1.0, ledger_store.BASE_CURRENCY, display_currency)
+        except (ValueError, ConnectionError) as e:
+            st.warning(f"Showing amounts in {ledger_store.BASE_CURRENCY}, the {display_currency} rate is unavailable: {e}")
+            display_currency = ledger_store.BASE_CURRENCY
+    spendings_history, income_history = st.session_state["sheet"].fetch_all(True, as_frame=True, shared=True)
+    for ledger, errors in st.session_state["sheet"].date_errors.items():
+        if errors:
+            st.warning(f"{len(errors)} {ledger} row(s) have a malformed date (expected YYYY-MM-DD): " + ", ".join(f"{i['worksheet']} row {i['row']} ({i['Date']})" for i in errors[:10]))
+    pending_writes = st.session_state["sheet"].pending_writes()
+    if pending_writes:
+        st.info(f"{pending_writes} change(s) saved locally, waiting to be written to Google Sheets.")
+        if st.session_state["sheet"].replication_error() is not None:
+            st.warning(f"Writing to Google Sheets failed, retrying: {st.session_state['sheet'].replication_error()}")
+    halted_worksheets = st.session_state["sheet"].halted_worksheets()
+    if halted_worksheets:
+        st.error(f"Writing to Google Sheets stopped for {', '.join(halted_worksheets)}, changes to them are only saved locally. See Settings > Diagnostics > Replication.")
+    summary = aggregation.scale_summary(aggregation.rollup_summary_cached(st.session_state["sheet"].data_version(), st.session_state["sheet"].rollups), display_rate)
+    total_balance(summary, display_currency)
+    spendings_index, income_index = st.session_state["sheet"].date_index("spendings"), st.session_state["sheet"].date_index("income")
+    transactions_data_editor(spendings_history, income_history, spendings_index, income_index)
+    period_summary(spendings_index, income_index, display_currency, display_rate)
+    net_spending_area_chart(summary)
+    display_spending_by_category(summary)
+    display_income_by_category(summary)
 
+telemetry.end_run()
@@ -1,6 +1,11 @@
 import streamlit as st
 import json
-from framework import nav_bar
+import math
+import pandas as pd
+from datetime import datetime, time
+from framework import nav_bar, rate_limit, telemetry, settings_store
+
+telemetry.start_run("settings")
 
 if ("authenticated" not in st.session_state) or not st.session_state["authenticated"]:
     st.switch_page("main.py")
@@ -19,24 +24,21 @@ st.title("Settings")
 @st.fragment
 def transaction_types_editor() -> None:
     st.header("Edit Transaction Types")
-    with open("settings/transaction_types.json", "r") as file:
-        transaction_types = json.load(file)
+    transaction_types = settings_store.transaction_types()
     transaction_types_tabs = st.tabs(["Spendings", "Income"])
     with transaction_types_tabs[0]:
         st.subheader("Spendings Transaction Types")
         edited_spending_types = st.data_editor(transaction_types["spending_types"], use_container_width=True, num_rows="dynamic")
         if st.button("Save", key="ssts") and edited_spending_types != transaction_types["spending_types"]:
             edited_spending_types = [i for i in edited_spending_types if i != ""]
-            transaction_types["spending_types"] = edited_spending_types
-            json.dump(transaction_types, open("settings/transaction_types.json", "w"), indent=4)
+            settings_store.update(settings_store.TRANSACTION_TYPES_PATH, "spending_types", edited_spending_types)
             st.session_state["log"].log_info("[UPDATED] Spendings transaction types updated.")
     with transaction_types_tabs[1]:
         st.subheader("Income Transaction Types")
         edited_income_types = st.data_editor(transaction_types["income_types"], use_container_width=True, num_rows="dynamic")
         if st.button("Save", key="ssti") and edited_income_types != transaction_types["income_types"]:
             edited_income_types = [i for i in edited_income_types if i != ""]
-            transaction_types["income_types"] = edited_income_types
-            json.dump(transaction_types, open("settings/transaction_types.json", "w"), indent=4)
+            settings_store.update(settings_store.TRANSACTION_TYPES_PATH, "income_types", edited_income_types)
             st.session_state["log"].log_info("[UPDATED] Income transaction types updated.")
 
 
@@ -76,13 +78,64 @@ def clear_logs() -> None:
             st.success("Logs cleared")
             st.switch_page("main.py")
 
+@st.fragment
 def logs() -> None:
     st.header("Logs")
-    logs = st.session_state["log"].fetch_logs()
-    st.json(logs, expanded=True)
+    if st.session_state["log"].write_error() is not None:
+        st.warning(f"Recent events could not be written to the log: {st.session_state['log'].write_error()}")
+    logs_filter_cols = st.columns([2, 2, 1, 1])
+    tags = logs_filter_cols[0].multiselect("Events", st.session_state["log"].log_tags())
+    date_range = logs_filter_cols[1].date_input("Date Range", value=(), format="DD/MM/YYYY")
+    page_size = logs_filter_cols[2].selectbox("Per Page", [25, 50, 100])
+    page = logs_filter_cols[3].number_input("Page", min_value=1, value=1, step=1)
+    start = datetime.combine(date_range[0], time.min) if len(date_range) > 0 else None
+    end = datetime.combine(date_range[-1], time.max) if len(date_range) > 0 else None
+    logs = st.session_state["log"].query_logs(offset=(page-1)*page_size, limit=page_size, start=start, end=end, tags=tags)
+    st.caption(f"{logs['total']} entries, page {page} of {max(1, math.ceil(logs['total']/page_size))}")
+    st.json({"logs": logs["logs"]}, expanded=True)
     if st.button("Clear Logs", type="primary"):
         clear_logs()
 
+@st.fragment
+def diagnostics() -> None:
+    st.header("Diagnostics")
+    runs = telemetry.history()
+    if not runs:
+        st.write("No reruns recorded yet.")
+        return
+    run_index = st.selectbox("Rerun", range(len(runs) - 1, -1, -1), format_func=lambda i: f"{runs[i]['started']} {runs[i]['name']}{' (interrupted)' if runs[i]['interrupted'] else ''}")
+    run = runs[run_index]
+    diagnostics_cols = st.columns(4)
+    diagnostics_cols[0].metric("Rerun Time", f"{run['elapsed']*1000:.0f} ms")
+    diagnostics_cols[1].metric("Sheets API Calls", run["counters"].get("sheets.calls", 0))
+    diagnostics_cols[2].metric("HTTP Received", f"{sum(v for k, v in run['counters'].items() if k.endswith('.bytes_in'))/1024:.1f} KB")
+    diagnostics_cols[3].metric("Throttled Calls (process)", rate_limit.get_scheduler().stats()["throttled"])
+    st.subheader("Stages")
+    stages = pd.DataFrame([{"Stage": stage, "Calls": v["calls"], "Time (ms)": v["seconds"]*1000} for stage, v in run["stages"].items()])
+    if len(stages):
+        st.dataframe(stages.sort_values("Time (ms)", ascending=False), use_container_width=True, hide_index=True)
+    diagnostics_tabs = st.tabs(["Caches", "Counters", "Memory", "Background", "Replication"])
+    with diagnostics_tabs[0]:
+        st.dataframe(pd.DataFrame([{"Cache": name, "Hits": v["hits"], "Misses": v["misses"], "Hit Ratio": v["ratio"]} for name, v in run["caches"].items()]), use_container_width=True, hide_index=True)
+    with diagnostics_tabs[1]:
+        st.dataframe(pd.DataFrame([{"Counter": name, "Value": value} for name, value in run["counters"].items()]), use_container_width=True, hide_index=True)
+    with diagnostics_tabs[2]:
+        st.caption("Ledgers held in memory, shared by every session of the process.")
+        st.dataframe(pd.DataFrame(st.session_state["sheet"].memory_report()), use_container_width=True, hide_index=True)
+    with diagnostics_tabs[3]:
+        st.json(telemetry.background(), expanded=False)
+    with diagnostics_tabs[4]:
+        for key in st.session_state["sheet"].halted_worksheets():
+            halted_cols = st.columns([3, 1])
+            halted_cols[0].error(f"Writing to {key} stopped: it could not be rebuilt from the local copy.")
+            if halted_cols[1].button("Rebuild", key=f"rebuild_{key}"):
+                st.session_state["sheet"].rebuild_worksheet(key)
+                st.session_state["log"].log_info(f"[REBUILD QUEUED] {key} will be rewritten from the local copy.")
+                st.rerun()
+        st.caption("Changes Google Sheets rejected for good. The worksheets they were meant for are rewritten from the local copy.")
+        st.dataframe(pd.DataFrame([{"Failed At": i["failed_at"], "Operation": i["method"], "Worksheet": i["ledger"], "Error": i["error"]} for i in st.session_state["sheet"].dead_letters()], columns=["Failed At", "Operation", "Worksheet", "Error"]), use_container_width=True, hide_index=True)
+    st.download_button("Export Diagnostics", json.dumps({"runs": runs, "background": telemetry.background(), "scheduler": rate_limit.get_scheduler().stats(), "memory": st.session_state["sheet"].memory_report()}, indent=4), file_name="diagnostics.json", mime="application/json")
+
 @st.dialog("Clear Transactions")
 def clear_transactions_dialog(type:str) -> None:
     """
@@ -127,7 +180,10 @@ your_infomation()
 data_base_info()
 transaction_types_editor()
 logs()
+diagnostics()
 clear_transactions()
 st.divider()
 if st.button("Log Out", type="secondary"):
     log_out()
+
+telemetry.end_run()
@@ -1,6 +1,7 @@
 import streamlit as st
-from framework import nav_bar, process_form
-import json
+from framework import nav_bar, process_form, telemetry, settings_store
+
+telemetry.start_run("spendings")
 
 if ("authenticated" not in st.session_state) or not st.session_state["authenticated"]:
     st.switch_page("main.py")
@@ -13,10 +14,8 @@ nav_bar.NavBar().render()
 
 st.title("Spendings Page")
 
-with open("settings/currencies.json", "r") as file:
-    currencies = json.load(file)
-with open("settings/transaction_types.json", "r") as file:
-    spending_types = json.load(file)
+currencies = settings_store.currencies()
+spending_types = settings_store.transaction_types()["spending_types"]
 
 @st.dialog("Submitting")
 def submitting(data:list[str, float, str, str, str, str]) -> bool:
@@ -34,6 +33,8 @@ def submitting(data:list[str, float, str, str, str, str]) -> bool:
     if submitted:
         st.session_state["log"].log_info("[SUBMITTED] Submitted the spendings form.")
         st.success("Submitted!")
+        if st.session_state["sheet"].pending_writes():
+            st.caption("Saved locally, it will be written to Google Sheets in the background.")
     else:
         st.error("Something went wrong")
 
@@ -43,11 +44,11 @@ with st.form("spendings_form", clear_on_submit=True):
     with spending_amount_cols[0]:
         spending_amount = st.number_input("Enter the amount of spending:", min_value=0.0, step=0.01)
     with spending_amount_cols[1]:
-        currency = st.selectbox("Currency", currencies["currencies"])
+        currency = st.selectbox("Currency", currencies)
 
     transaction_date = st.date_input("Transaction Date", value=None,format="DD/MM/YYYY")
 
-    transaction_type = st.selectbox("Transaction Type", spending_types["spending_types"])
+    transaction_type = st.selectbox("Transaction Type", spending_types)
 
     comments = st.text_area("Comments", placeholder="Add any additional details about the transaction...")
 
@@ -59,4 +60,6 @@ with st.form("spendings_form", clear_on_submit=True):
             st.warning("There is an error in the form")
         else:
             submitting(["spendings", spending_amount, currency, transaction_date, transaction_type, comments])
-            st.success(f"You have entered a spending amount of {spending_amount:.2f} {currency} on {transaction_date.strftime('%d/%m/%Y')} for {transaction_type}. Comments: {comments}")
\ No newline at end of file
+            st.success(f"You have entered a spending amount of {spending_amount:.2f} {currency} on {transaction_date.strftime('%d/%m/%Y')} for {transaction_type}. Comments: {comments}")
+
+telemetry.end_run()